@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the sorter template tags and ordering pipeline.
+
+Runs against an in-memory SQLite database using the test settings and
+writes the results as JSON, e.g.::
+
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --compare before.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sorter.test_settings')
+
+import django  # noqa
+django.setup()
+
+from django.contrib.admin.models import LogEntry  # noqa
+from django.core.management import call_command  # noqa
+from django.template import Context, Template  # noqa
+from django.test.client import RequestFactory  # noqa
+from django.test.utils import override_settings  # noqa
+
+from model_mommy import mommy  # noqa
+
+from sorter.state import SortState  # noqa
+from sorter.templatetags.sorter_tags import SortURL  # noqa
+
+rf = RequestFactory()
+benchmarks = []
+
+
+def benchmark(name, number=1000):
+    """
+    Registers the decorated function, which returns the callable to time.
+    """
+    def decorator(func):
+        benchmarks.append((name, number, func))
+        return func
+    return decorator
+
+
+def long_query(count, **extra):
+    query = dict(('filter%s' % i, 'value %s' % i) for i in range(count))
+    query.update(extra)
+    return query
+
+
+def criteria(count):
+    # half of the criteria are wildcards
+    return ['field%s' % i if i % 2 else 'related%s__*' % i for i in range(count)]
+
+
+CRITERIA_COUNTS = (1, 10, 100)
+ALLOWED_CRITERIA = dict([('sort', ['*']), ('sort_objects', ['*'])] +
+                        [('sort_criteria%s' % count, criteria(count))
+                         for count in CRITERIA_COUNTS])
+
+
+def ordering_benchmark(count):
+    def setup():
+        name = 'sort_criteria%s' % count
+        fields = ','.join(['-field%s' % (count - 1), 'related0__title', 'unknown'])
+        request = rf.get('/', {name: fields})
+
+        def run():
+            SortState(request).ordering(name)
+        return run
+    return setup
+
+
+for count in CRITERIA_COUNTS:
+    benchmark('ordering.criteria_%s' % count)(ordering_benchmark(count))
+
+
+def sortlink_benchmark(links, params):
+    def setup():
+        template = Template(''.join(
+            '{%% sortlink with "objects" by "field%s" "-field%s" %%}Label{%% endsortlink %%}' %
+            (i, i) for i in range(links)))
+        request = rf.get('/', long_query(params, sort_objects='field0'))
+
+        def run():
+            template.render(Context({'request': request}))
+        return run
+    return setup
+
+
+for links in (1, 10, 100):
+    for params in (0, 50):
+        benchmark('sortlink.links_%s.params_%s' % (links, params),
+                  number=max(10, 1000 // links))(sortlink_benchmark(links, params))
+
+
+@benchmark('sorturl.as_value.params_50')
+def sorturl_as_value():
+    template = Template('{% sorturl with "objects" by "field0" "-field0" as url %}')
+    node = template.compile_nodelist()[0]
+    request = rf.get('/', long_query(50, sort_objects='field0'))
+    data = {'with': 'sort_objects', 'by': ['field0', '-field0']}
+
+    def run():
+        node.as_value(data, Context({'request': request}))
+    return run
+
+
+def find_query_benchmark(length):
+    def setup():
+        node = SortURL.__new__(SortURL)
+        orderings = ['field%s' % i for i in range(length)]
+        wanted = orderings[-2]
+
+        def run():
+            node.find_query(wanted, orderings, orderings[0])
+        return run
+    return setup
+
+
+for length in (2, 20, 200):
+    benchmark('find_query.cycle_%s' % length,
+              number=10000 // length)(find_query_benchmark(length))
+
+
+@benchmark('page.render', number=50)
+def page_render():
+    if not LogEntry.objects.exists():
+        for i in range(200):
+            mommy.make(LogEntry)
+    template = Template("""
+        {% sort objects with "objects" as sorted %}
+        <table><tr>
+        {% for field in fields %}
+            <th>{% sortlink with "objects" by field "-id" %}{{ field }}{% endsortlink %}</th>
+        {% endfor %}
+        </tr>
+        {% for obj in sorted %}<tr><td>{{ obj.pk }}</td><td>{{ obj.object_repr }}</td></tr>{% endfor %}
+        </table>""")
+    request = rf.get('/', long_query(20, sort_objects='-id'))
+    fields = ['id', 'action_time', 'object_repr', 'object_id', 'action_flag',
+              'user__username', 'content_type__model', 'change_message']
+    objects = LogEntry.objects.all()
+
+    def run():
+        template.render(Context({'request': request, 'objects': objects,
+                                 'fields': fields}))
+    return run
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, repeat=5):
+    results = {}
+    for name, number, setup in benchmarks:
+        if names and not any(part in name for part in names):
+            continue
+        timer = timeit.Timer(setup())
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = {'seconds': best, 'number': number, 'repeat': repeat}
+        sys.stderr.write('%-40s %10.1f us\n' % (name, best * 1e6))
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': results,
+    }
+
+
+def compare(old, new):
+    for name, result in sorted(new['results'].items()):
+        previous = old['results'].get(name)
+        if previous:
+            ratio = result['seconds'] / previous['seconds']
+            sys.stdout.write('%-40s %10.1f us %+7.1f%%\n' %
+                             (name, result['seconds'] * 1e6, (ratio - 1) * 100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*',
+                        help='Only run benchmarks containing one of the names.')
+    parser.add_argument('--output', help='Write the JSON results to the file.')
+    parser.add_argument('--compare', help='Compare with the JSON results in the file.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    call_command('migrate', verbosity=0, interactive=False)
+    with override_settings(SORTER_ALLOWED_CRITERIA=ALLOWED_CRITERIA):
+        results = run(args.names, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=100)
+
+
+class Post(models.Model):
+    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    created = models.DateTimeField(db_index=True)
+    score = models.IntegerField(db_index=True)
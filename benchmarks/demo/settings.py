@@ -0,0 +1,45 @@
+"""
+Settings of the demo project of the load harness, see ``loadtest.py``.
+"""
+import os
+import tempfile
+
+DEBUG = False
+
+SECRET_KEY = 'sorter-load'
+
+ALLOWED_HOSTS = ['testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SORTER_LOAD_DB',
+                               os.path.join(tempfile.gettempdir(), 'sorter-load.sqlite3')),
+    }
+}
+
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'sorter',
+    'demo',
+]
+
+MIDDLEWARE = [
+    'sorter.middleware.SortStateMiddleware',
+]
+
+ROOT_URLCONF = 'demo.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
+USE_I18N = True
+
+SORTER_ALLOWED_CRITERIA = {
+    'sort_posts': ['created', 'score', 'title', 'author__name'],
+}
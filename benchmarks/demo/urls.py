@@ -0,0 +1,7 @@
+from django.conf.urls import url
+
+from demo import views
+
+urlpatterns = [
+    url(r'^posts/$', views.post_list),
+]
@@ -0,0 +1,10 @@
+from django.shortcuts import render
+
+from demo.models import Post
+
+
+def post_list(request):
+    return render(request, 'demo/post_list.html', {
+        'request': request,
+        'posts': Post.objects.select_related('author'),
+    })
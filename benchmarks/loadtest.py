@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+End-to-end load harness of a sorted list page of the demo project.
+
+Fills an SQLite database with generated posts, drives concurrent requests
+with a mix of sort parameters against a view using the ``{% sort %}`` and
+``{% sortlink %}`` template tags and reports the latency percentiles and
+queries per request. The query plan of each ordering is recorded, so that
+an ordering which stops using an index is flagged, e.g.::
+
+    python benchmarks/loadtest.py --rows 1000000 --output before.json
+    python benchmarks/loadtest.py --rows 1000000 --compare before.json
+
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(here), here]
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'demo.settings')
+
+import django  # noqa
+django.setup()
+
+from django.core.management import call_command  # noqa
+from django.db import connection, transaction  # noqa
+from django.test.client import Client  # noqa
+from django.test.utils import CaptureQueriesContext  # noqa
+from django.utils.six.moves import queue  # noqa
+
+from sorter.guard import estimate, explain  # noqa
+
+from demo.models import Author, Post  # noqa
+
+SORTS = [
+    '', 'created', '-created', 'score', '-score', 'title', '-title',
+    'author__name', '-author__name', '-score,created', 'created,title',
+]
+
+
+def generate(rows, authors=1000, batch_size=10000, seed=0):
+    """
+    Replaces the posts and authors with the given number of random ones.
+    """
+    rng = random.Random(seed)
+    start = datetime(2010, 1, 1)
+    with transaction.atomic():
+        Post.objects.all().delete()
+        Author.objects.all().delete()
+        Author.objects.bulk_create(Author(name='Author %06d' % rng.randint(0, 999999))
+                                   for i in range(authors))
+        author_ids = list(Author.objects.values_list('pk', flat=True))
+        for offset in range(0, rows, batch_size):
+            Post.objects.bulk_create(
+                Post(author_id=rng.choice(author_ids),
+                     title='Post %08d' % rng.randint(0, 99999999),
+                     created=start + timedelta(minutes=rng.randint(0, 5000000)),
+                     score=rng.randint(0, 10000))
+                for i in range(offset, min(offset + batch_size, rows)))
+
+
+def plans():
+    """
+    Returns the query plan of each ordering of the mix and whether it
+    sorts the rows without an index.
+    """
+    result = {}
+    for sort in SORTS:
+        if not sort:
+            continue
+        plan = explain(Post.objects.select_related('author')
+                       .order_by(*sort.split(','))[:50])
+        result[sort] = {'plan': plan, 'filesort': estimate(plan)[2]}
+    return result
+
+
+def worker(requests, results, seed):
+    client = Client()
+    rng = random.Random(seed)
+    while True:
+        try:
+            requests.get_nowait()
+        except queue.Empty:
+            return
+        sort = rng.choice(SORTS)
+        query = {'page': rng.randint(1, 10)}
+        if sort:
+            query['sort_posts'] = sort
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            response = client.get('/posts/', query)
+            elapsed = time.time() - started
+        assert response.status_code == 200, response.status_code
+        results.append((sort, elapsed, len(queries)))
+    connection.close()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def summary(results):
+    latencies = [elapsed * 1000 for sort, elapsed, count in results]
+    return {
+        'requests': len(results),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries_per_request': float(sum(count for sort, elapsed, count in results)) /
+        len(results),
+    }
+
+
+def load(count, concurrency):
+    """
+    Sends the given number of requests from the given number of threads
+    and returns the summary of all requests and the one of each sort.
+    """
+    requests = queue.Queue()
+    for i in range(count):
+        requests.put(i)
+    results = []
+    threads = [threading.Thread(target=worker, args=(requests, results, seed))
+               for seed in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = summary(results)
+    total['requests_per_second'] = len(results) / (time.time() - started)
+    sorts = {}
+    for sort in SORTS:
+        sort_results = [result for result in results if result[0] == sort]
+        if sort_results:
+            sorts[sort or '(none)'] = summary(sort_results)
+    return total, sorts
+
+
+def compare(previous, current):
+    """
+    Prints the change of the latencies and the orderings that sort
+    without an index now, returning whether there are any.
+    """
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+        before, after = previous['total'][key], current['total'][key]
+        change = before and (after - before) / before * 100 or 0
+        print('%-24s %10.2f %10.2f %+8.1f%%' % (key, before, after, change))
+    regressions = [sort for sort, plan in sorted(current['plans'].items())
+                   if plan['filesort'] and
+                   not previous['plans'].get(sort, {}).get('filesort', True)]
+    for sort in regressions:
+        print('REGRESSION: ordering %r sorts without an index now:\n%s' %
+              (sort, current['plans'][sort]['plan']))
+    return bool(regressions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='The number of posts to generate.')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='Write the JSON results to the file.')
+    parser.add_argument('--compare', help='Compare with the JSON results in the file.')
+    args = parser.parse_args(argv)
+
+    call_command('migrate', run_syncdb=True, verbosity=0, interactive=False)
+    if Post.objects.count() != args.rows:
+        generate(args.rows)
+
+    total, sorts = load(args.requests, args.concurrency)
+    results = {
+        'rows': args.rows,
+        'concurrency': args.concurrency,
+        'total': total,
+        'sorts': sorts,
+        'plans': plans(),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as previous:
+            if compare(json.load(previous), results):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,10 +26,12 @@ setup(
     author_email='jannis@leidel.info',
     license='BSD',
     url='https://django-sorter.readthedocs.io/',
-    packages=['sorter', 'sorter.templatetags'],
+    packages=['sorter', 'sorter.templatetags',
+              'sorter.management', 'sorter.management.commands'],
     package_data={
         'sorter': [
             'templates/sorter/*.html',
+            'jinja2/sorter/*.html',
             'locale/*/*/*',
         ],
     },
@@ -1 +1,2 @@
 __version__ = "0.3"
+default_app_config = 'sorter.apps.SorterConfig'
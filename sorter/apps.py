@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.core import checks
+
+from sorter.cache import connect_models
+from sorter.checks import check_indexes
+
+
+class SorterConfig(AppConfig):
+    name = 'sorter'
+    verbose_name = 'Sorter'
+
+    def ready(self):
+        checks.register(check_indexes, checks.Tags.models)
+        connect_models()
@@ -0,0 +1,269 @@
+from itertools import chain
+
+from django.db import connections
+from django.db.models.query import ModelIterable
+from django.utils.six import string_types
+from django.utils.text import get_text_list
+from django.utils.translation import ugettext as _
+
+from sorter.cache import cached_ordering
+from sorter.conf import settings, get_matcher
+from sorter.guard import guard_ordering
+from sorter.keyset import batches, cursor_name, expand_ordering, keyset_ordering, paginate
+from sorter.prefetch import top_prefetch
+from sorter.state import get_state
+from sorter.utils import (cycle_pairs, is_cached, related_paths, resolve_ordering,
+                          sort_objects)
+
+
+def query_name(value):
+    """
+    Returns the name of the querystring parameter for the given
+    name of the sorting, prefixing it with the default query name.
+    """
+    # in case the value equals the default query name
+    # or it already has the default query name prefixed
+    if (value == settings.SORTER_DEFAULT_QUERY_NAME or
+            value.startswith(settings.SORTER_DEFAULT_QUERY_NAME)):
+        return value
+    return '%s_%s' % (settings.SORTER_DEFAULT_QUERY_NAME, value)
+
+
+def sort_title(query):
+    """
+    Returns the title of the link or form input of the given query.
+    """
+    parts = []
+    for part in query.split(','):
+        part = part.strip()
+        if part.startswith('-'):
+            part = part.lstrip('-')
+            # Translators: Used in title of descending sort fields
+            text = _("'%(sort_field)s' (desc)")
+        else:
+            # Translators: Used in title of ascending sort fields
+            text = _("'%(sort_field)s' (asc)")
+        parts.append(text % {'sort_field': part})
+    # Translators: Used for the link/form input title excluding the sort fields
+    return (_('Sort by: %(sort_fields)s') %
+            {'sort_fields': get_text_list(parts, _('and'))})
+
+
+def template_names(template_name, name):
+    """
+    Returns the names of the templates of the sort link or form,
+    'sorter/sortlink.html' by default and 'sorter/sortlink_NAME.html'
+    additionally if a name of the sorting is given.
+    """
+    names = [template_name]
+    if name and name != settings.SORTER_DEFAULT_QUERY_NAME:
+        names.append(u'%s_%s' % (template_name, name))
+    return [u"sorter/%s.html" % template for template in names]
+
+
+class Sorter(object):
+    """
+    Sorts objects by the ordering found in the querystring of the given
+    request, the same way the template tags do, e.g. in a view::
+
+        sorter = Sorter(request, 'posts')
+        posts = sorter.sort(Post.objects.all())
+
+    """
+    def __init__(self, request, name=None):
+        self.name = query_name(name or settings.SORTER_DEFAULT_QUERY_NAME)
+        self.state = get_state(request)
+
+    @property
+    def request(self):
+        return self.state.request
+
+    @property
+    def ordering(self):
+        """
+        The list of validated ordering values of the request.
+        """
+        return self.state.ordering(self.name)
+
+    @property
+    def presorted(self):
+        """
+        Whether the objects were already sorted for this request, e.g.
+        in a view, so the template tags don't need to sort them again.
+        """
+        return self.name in self.state.presorted
+
+    def sort(self, value, limit=None, keyset=None, cache=None, ordering=None):
+        """
+        Returns the given value sorted by the ordering of the request
+        (or the given one), optionally limited to the first ``limit``
+        objects, as a keyset page with ``keyset`` objects or using the
+        cache with the given timeout.
+        """
+        if ordering is None:
+            ordering = self.ordering
+        if not keyset and self.is_evaluated(value, ordering):
+            if not ordering and limit is None:
+                return value
+            # sort the fetched rows, e.g. of prefetched related objects,
+            # instead of querying them again
+            nulls_largest = connections[value.db].features.nulls_order_largest
+            return sort_objects(value, expand_ordering(value.model, ordering),
+                                limit, nulls_largest)
+        if ordering and hasattr(value, 'order_by'):
+            value, ordering = self.prepare(value, ordering, keyset=bool(keyset))
+        if keyset:
+            return self.keyset_page(value, ordering, keyset)
+        if hasattr(value, 'order_by'):
+            if cache:
+                return cached_ordering(value, ordering, limit, cache)
+            if ordering:
+                value = value.order_by(*ordering)
+            if limit is not None:
+                value = value[:limit]
+            return value
+        # sort lists, dicts and other iterables in Python, skipping the
+        # sort aliases as they're query expressions
+        aliases = self.aliases
+        ordering = [field for field in ordering if field.lstrip('-') not in aliases]
+        if not ordering and limit is None:
+            return value
+        return sort_objects(value, ordering, limit)
+
+    def is_evaluated(self, value, ordering):
+        """
+        Returns whether the given value is a QuerySet whose model instances
+        are already fetched and can be sorted by the given ordering in
+        Python, including the related objects the ordering spans, which
+        are sorted by the ordering of their model like in the database.
+        """
+        if (getattr(value, '_result_cache', None) is None or
+                getattr(value, '_iterable_class', None) is not ModelIterable):
+            return False
+        aliases = self.aliases
+        if any(field.lstrip('-') in aliases for field in ordering):
+            return False
+        paths = [field.lstrip('-') for field in expand_ordering(value.model, ordering)
+                 if '__' in field]
+        return not paths or all(is_cached(obj, path) for obj in value._result_cache
+                                for path in paths)
+
+    @property
+    def aliases(self):
+        """
+        The sort aliases allowed for this sorting, by name.
+        """
+        matcher = get_matcher(self.name)
+        return matcher.aliases if matcher is not None else {}
+
+    def prepare(self, queryset, ordering, keyset=False):
+        """
+        Returns the given queryset and ordering ready for sorting: the sort
+        aliases replaced by their expressions (or annotated with them for
+        keyset pagination), checked by the guard and with the related
+        objects of the ordering selected.
+        """
+        aliases = self.aliases
+        names = [value.lstrip('-') for value in ordering
+                 if value.lstrip('-') in aliases]
+        if names and keyset:
+            # the cursors need the values of the sort keys
+            queryset = queryset.annotate(**dict(
+                (name, getattr(aliases[name], 'expression', aliases[name]))
+                for name in names))
+        elif names:
+            ordering = resolve_ordering(ordering, aliases)
+        if settings.SORTER_GUARD:
+            ordering = guard_ordering(queryset, ordering)
+        # load the related objects with the joins used for sorting, unless
+        # fields are deferred, which can't be combined with select_related()
+        paths = related_paths(queryset.model, [
+            value for value in ordering if isinstance(value, string_types) and
+            value.lstrip('-') not in aliases])
+        if (paths and getattr(queryset, '_fields', None) is None and
+                not queryset.query.deferred_loading[0]):
+            queryset = queryset.select_related(*paths)
+        return queryset, ordering
+
+    def batches(self, queryset, size=1000, ordering=None):
+        """
+        Yields the objects of the given queryset sorted by the ordering of
+        the request (or the given one) in lists of up to ``size`` objects,
+        using keyset pagination instead of offsets.
+        """
+        if ordering is None:
+            ordering = self.ordering
+        if ordering:
+            queryset, ordering = self.prepare(queryset, ordering, keyset=True)
+        return batches(queryset, ordering, size)
+
+    def iterate(self, queryset, size=1000, ordering=None):
+        """
+        Returns an iterator over the objects of the given queryset sorted
+        by the ordering of the request (or the given one), fetched in
+        batches of ``size`` objects.
+        """
+        return chain.from_iterable(self.batches(queryset, size, ordering))
+
+    def prefetch(self, lookup, queryset, field, limit, to_attr=None):
+        """
+        Returns a ``Prefetch`` object fetching the first ``limit`` related
+        objects of each parent object sorted by the ordering of the request
+        in a single query, e.g. the five newest comments of each post::
+
+            posts = Post.objects.prefetch_related(
+                sorter.prefetch('comments', Comment.objects.all(), 'post', 5))
+
+        """
+        # the primary key makes the ranks of equal sort keys deterministic
+        ordering = keyset_ordering(queryset, self.ordering)
+        queryset, ordering = self.prepare(queryset, ordering)
+        return top_prefetch(lookup, queryset, field, ordering, limit, to_attr)
+
+    def presort(self, value, **kwargs):
+        """
+        Sorts the given value like :meth:`sort` and marks the sorting
+        as done for the template tags of the request.
+        """
+        value = self.sort(value, **kwargs)
+        self.state.presorted.add(self.name)
+        return value
+
+    def keyset_page(self, value, ordering, per_page):
+        """
+        Returns the keyset page of the given queryset selected by the
+        cursor found in the request's querystring.
+        """
+        name = cursor_name(self.name)
+        page = paginate(value, ordering, self.request.GET.get(name), per_page)
+        if page.next_cursor:
+            page.next_url = self.state.sort_url(name, page.next_cursor)
+        if page.previous_cursor:
+            page.previous_url = self.state.sort_url(name, page.previous_cursor)
+        return page
+
+    @staticmethod
+    def find_query(wanted, orderings, default):
+        """
+        Given the list of order statements and a query that is currently
+        found in the request's querystring returns the next in line,
+        or falls back to the given default.
+        """
+        for current, next in cycle_pairs(orderings):
+            if current == wanted:
+                return next
+        return default
+
+    def next_query(self, orderings):
+        """
+        Returns the query following the current one in the given
+        list of order statements.
+        """
+        return self.find_query(self.state.current_query(self.name),
+                               orderings, orderings[0])
+
+    def url(self, orderings):
+        """
+        Returns the URL to the next query of the given order statements.
+        """
+        return self.state.sort_url(self.name, self.next_query(orderings))
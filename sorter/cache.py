@@ -0,0 +1,117 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_bytes
+
+from sorter.conf import settings
+from sorter.indexes import get_models
+
+# The models whose changes invalidate the cached orderings
+invalidated_models = set()
+
+
+def get_cache():
+    return caches[settings.SORTER_CACHE]
+
+
+def version_key(model):
+    return 'sorter:version:%s' % model._meta.label_lower
+
+
+def get_version(model):
+    """
+    Returns the current version of the cached orderings of the given model.
+    """
+    cache = get_cache()
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        # starting with the current time so that a version that got
+        # evicted from the cache doesn't resurrect stale orderings
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(sender, **kwargs):
+    """
+    Invalidates all cached orderings of the model that was saved or deleted.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(version_key(sender))
+    except ValueError:
+        get_version(sender)
+
+
+def connect_invalidation(model):
+    if model in invalidated_models:
+        return
+    uid = 'sorter.cache.%s' % model._meta.label_lower
+    post_save.connect(invalidate, sender=model, dispatch_uid=uid)
+    post_delete.connect(invalidate, sender=model, dispatch_uid=uid)
+    invalidated_models.add(model)
+
+
+def connect_models():
+    """
+    Connects the invalidation of the cached orderings of the models of
+    the SORTER_MODELS setting, so that saving or deleting their objects
+    invalidates them in processes that never sort them, e.g. the admin
+    or task workers.
+    """
+    try:
+        models = get_models()
+    except (LookupError, ValueError):  # reported by the system check
+        return
+    for model in models.values():
+        connect_invalidation(model)
+
+
+def cache_key(queryset, limit=None):
+    """
+    Returns the cache key of the primary keys of the given (ordered)
+    queryset, based on its SQL and parameters and the model's version.
+    """
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(force_bytes('%s|%r|%r' % (sql, params, limit))).hexdigest()
+    return 'sorter:pks:%s:%s:%s' % (queryset.model._meta.label_lower,
+                                    get_version(queryset.model), digest)
+
+
+def cached_ordering(queryset, ordering, limit=None, timeout=None):
+    """
+    Returns a list of the first ``limit`` objects of the given queryset
+    sorted by the given ordering.
+
+    The sorted primary keys are stored in the cache, so that following
+    calls only fetch the rows by primary key and sort them in Python,
+    until the timeout expires or an object of the model is saved or
+    deleted. The limit is required to keep the cached lists and the
+    queries of the rows small.
+    """
+    if limit is None:
+        raise ValueError("Cached orderings need a limit")
+    if timeout is None:
+        timeout = settings.SORTER_CACHE_TIMEOUT
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    connect_invalidation(queryset.model)
+    try:
+        key = cache_key(queryset, limit)
+    except EmptyResultSet:
+        return []
+    cache = get_cache()
+    pks = cache.get(key)
+    if pks is None:
+        pks = list(queryset.values_list('pk', flat=True)[:limit])
+        cache.set(key, pks, timeout)
+    objects = dict((obj.pk, obj) for obj in
+                   queryset.order_by().filter(pk__in=pks))
+    return [objects[pk] for pk in pks if pk in objects]
@@ -0,0 +1,35 @@
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+
+from sorter.indexes import get_models, unindexed_orderings
+
+
+def check_indexes(app_configs=None, **kwargs):
+    """
+    Warns about allowed criteria of the models of the SORTER_MODELS
+    setting that aren't backed by a database index.
+    """
+    errors = []
+    try:
+        models = get_models()
+    except (LookupError, ValueError) as exc:
+        return [checks.Error("The SORTER_MODELS setting is invalid: %s" % exc,
+                             id='sorter.E001')]
+    for name, model in sorted(models.items()):
+        if app_configs is not None and model._meta.app_config not in app_configs:
+            continue
+        try:
+            orderings = unindexed_orderings(name, model)
+        except FieldDoesNotExist as exc:
+            errors.append(checks.Error(
+                "The allowed criteria of '%s' are invalid: %s" % (name, exc),
+                obj=model, id='sorter.E002'))
+            continue
+        for ordering in orderings:
+            errors.append(checks.Warning(
+                "Sorting '%s' by '%s' isn't backed by a database index." %
+                (name, ','.join(ordering)),
+                hint="Run 'manage.py sorter_indexes --suggest' for "
+                     "index definitions.",
+                obj=model, id='sorter.W001'))
+    return errors
@@ -1,13 +1,100 @@
+import re
+from collections import Mapping
+from fnmatch import translate
+
 from django.conf import settings  # noqa
 from django.core.exceptions import ImproperlyConfigured
 from appconf import AppConf
 
+# the characters which make fnmatch treat a criteria as a pattern
+wildcards_re = re.compile(r'[*?[]')
+
+
+class CriteriaMatcher(object):
+    """
+    Matches sort fields against a list of allowed criteria.
+
+    Criteria without any Unix shell-style wildcards are looked up in a set,
+    the remaining ones are combined into a single regular expression.
+    Dictionaries map the names of sort aliases to query expressions.
+    """
+    def __init__(self, criteria):
+        self.exact = set()
+        self.aliases = {}
+        patterns = []
+        for criterion in criteria:
+            if isinstance(criterion, Mapping):
+                self.aliases.update(criterion)
+            elif wildcards_re.search(criterion):
+                patterns.append('(?:%s)' % translate(criterion))
+            else:
+                self.exact.add(criterion)
+        if patterns:
+            self.pattern = re.compile('|'.join(patterns))
+        else:
+            self.pattern = None
+
+    def __call__(self, field):
+        """
+        Returns whether the given field name (without any
+        leading ``-``) is allowed.
+        """
+        if field in self.exact or field in self.aliases:
+            return True
+        return self.pattern is not None and self.pattern.match(field) is not None
+
+
+def compile_criteria(value):
+    """
+    Given the value of the SORTER_ALLOWED_CRITERIA setting returns
+    a mapping of query names to criteria matchers.
+    """
+    return dict((name, CriteriaMatcher(criteria))
+                for name, criteria in (value or {}).items())
+
+
+# the setting value the matchers were compiled from and the matchers
+_matchers = (None, {})
+
+
+def get_matcher(name):
+    """
+    Returns the criteria matcher of the given query name or ``None``
+    if there aren't any allowed criteria for it.
+
+    The matchers are compiled again as soon as the setting is replaced,
+    e.g. when using ``override_settings`` in tests.
+    """
+    global _matchers
+    value = settings.SORTER_ALLOWED_CRITERIA
+    source, matchers = _matchers
+    if source is not value:
+        matchers = compile_criteria(value)
+        _matchers = (value, matchers)
+    return matchers.get(name)
+
 
 class SorterConf(AppConf):
     DEFAULT_QUERY_NAME = 'sort'
     ALLOWED_CRITERIA = None
+    INHERIT_CONTEXT = False
+    MAX_CRITERIA = 10
+    MODELS = {}
+    CACHE = 'default'
+    CACHE_TIMEOUT = 300
+    TIMING = False
+    GUARD = False
+    GUARD_MAX_COST = None
+    GUARD_MAX_ROWS = None
+    GUARD_ALLOW_FILESORT = True
+    GUARD_ACTION = 'default'
+    GUARD_TIMEOUT = 3600
+    FRAGMENT_TIMEOUT = 300
+    CANONICAL = False
+    DEFAULT_ORDERINGS = {}
 
     def configure_ALLOWED_CRITERIA(self, value):
+        global _matchers
         if not value:
             raise ImproperlyConfigured("The SORTER_ALLOWED_CRITERIA "
                                        "setting is empty. Please set it.")
@@ -16,4 +103,5 @@ class SorterConf(AppConf):
                 raise ImproperlyConfigured("The '%s' SORTER_ALLOWED_CRITERIA "
                                            "setting is empty. Please set it." %
                                            name)
+        _matchers = (value, compile_criteria(value))
         return value or {}
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.encoding import force_bytes
+from django.views.decorators.http import condition
+
+from sorter.base import Sorter
+from sorter.cache import connect_invalidation, get_version
+
+
+def validators(request, queryset, name=None, updated_field=None):
+    """
+    Returns the ETag and the last modification time (if the field holding
+    the modification time of the objects is given) of the given queryset
+    sorted by the ordering of the request.
+
+    They're based on the validated ordering, the other querystring
+    parameters, the number of objects and their latest modification,
+    which only takes a single aggregate query, and the version of the
+    model of the cached orderings, which changes whenever one of its
+    objects is saved or deleted.
+    """
+    sorter = Sorter(request, name)
+    state = sorter.state
+    try:
+        return state.validators[sorter.name]
+    except KeyError:
+        pass
+    aggregates = {'count': Count('pk')}
+    if updated_field is not None:
+        aggregates['updated'] = Max(updated_field)
+    values = queryset.order_by().aggregate(**aggregates)
+    params = sorted((key, value) for key, value in state.canonical_params.items()
+                    if key != sorter.name)
+    # changes that keep the number of objects don't change the count
+    connect_invalidation(queryset.model)
+    etag = hashlib.md5(force_bytes('%s|%s|%r|%s|%s|%s' % (
+        sorter.name, ','.join(sorter.ordering), params,
+        values['count'], values.get('updated'), get_version(queryset.model)))).hexdigest()
+    result = state.validators[sorter.name] = (etag, values.get('updated'))
+    return result
+
+
+def sorted_condition(queryset, name=None, updated_field=None):
+    """
+    A view decorator answering conditional GET requests for the given
+    queryset (or a callable returning it for the request and arguments
+    of the view) sorted by the ordering of the request with
+    ``304 Not Modified``, before the view runs the sorted query::
+
+        @sorted_condition(Post.objects.all(), 'posts', 'updated_at')
+        def post_list(request):
+            # ...
+
+    """
+    def get_queryset(request, *args, **kwargs):
+        if callable(queryset):
+            return queryset(request, *args, **kwargs)
+        return queryset
+
+    def etag(request, *args, **kwargs):
+        return validators(request, get_queryset(request, *args, **kwargs),
+                          name, updated_field)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request, get_queryset(request, *args, **kwargs),
+                          name, updated_field)[1]
+
+    if updated_field is None:
+        return condition(etag_func=etag)
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,87 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_str
+
+from sorter.base import Sorter
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo(object):
+    """
+    A file-like object returning what's written to it, to get the
+    lines of the csv writer one at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def field_value(obj, field):
+    """
+    Returns the value of the given (possibly ``__`` separated) field
+    of the given object or dictionary.
+    """
+    for part in field.split('__'):
+        if obj is None:
+            break
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        else:
+            obj = getattr(obj, part)
+    return obj
+
+
+def csv_lines(objects, fields):
+    """
+    Yields the header line and a line for each of the given objects
+    with the values of the given fields in CSV format.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([force_str(field) for field in fields])
+    for obj in objects:
+        values = (field_value(obj, field) for field in fields)
+        yield writer.writerow(['' if value is None else force_str(value)
+                               for value in values])
+
+
+def jsonl_lines(objects, fields):
+    """
+    Yields a JSON object with the values of the given fields for each
+    of the given objects, one per line.
+    """
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for obj in objects:
+        yield '%s\n' % encoder.encode(
+            dict((field, field_value(obj, field)) for field in fields))
+
+
+formats = {
+    'csv': csv_lines,
+    'jsonl': jsonl_lines,
+}
+
+
+def export_response(request, queryset, fields, format='csv', name=None,
+                    filename=None, size=1000):
+    """
+    Returns a streaming response with the given fields of the objects
+    of the queryset, sorted by the ordering found in the querystring of
+    the request, in CSV or JSON Lines format.
+
+    The objects are fetched in keyset-paginated batches of ``size``
+    objects, so the memory use doesn't grow with the size of the export.
+    """
+    if format not in formats:
+        raise ValueError("Unknown export format %r, use one of: %s" %
+                         (format, ', '.join(sorted(formats))))
+    objects = Sorter(request, name).iterate(queryset, size)
+    response = StreamingHttpResponse(formats[format](objects, fields),
+                                     content_type=CONTENT_TYPES[format])
+    if filename is not None:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import re
+
+from django.core.exceptions import SuspiciousOperation
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+from django.db import connections
+from django.utils.encoding import force_bytes, force_text
+
+from sorter.cache import get_cache
+from sorter.conf import settings
+
+logger = logging.getLogger('sorter')
+logger.addHandler(logging.NullHandler())
+
+cost_re = re.compile(r'cost=[\d.]+\.\.([\d.]+)')
+rows_re = re.compile(r'\brows=(\d+)')
+filesort_re = re.compile(r'USE TEMP B-TREE FOR .*ORDER BY|Using filesort|'
+                         r'^\s*(?:->\s*)?Sort\b', re.M)
+
+
+class DisallowedOrdering(SuspiciousOperation):
+    """
+    Raised when an ordering exceeds the budget of the cost guard
+    and the SORTER_GUARD_ACTION setting is ``'reject'``.
+    """
+
+
+def explain(queryset):
+    """
+    Returns the query plan of the given queryset as text.
+    """
+    if hasattr(queryset, 'explain'):
+        return queryset.explain()
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    prefix = connection.vendor == 'sqlite' and 'EXPLAIN QUERY PLAN' or 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute('%s %s' % (prefix, sql), params)
+        names = [column[0] for column in cursor.description]
+        if len(names) == 1:
+            return '\n'.join('%s' % row[0] for row in cursor.fetchall())
+        return '\n'.join(' '.join('%s=%s' % pair for pair in zip(names, row))
+                         for row in cursor.fetchall())
+
+
+def estimate(plan):
+    """
+    Returns the estimated total cost, the largest number of rows of any
+    step and whether the rows are sorted without an index, as far as
+    the database's query plan tells.
+    """
+    cost = cost_re.search(plan)
+    rows = [int(value) for value in rows_re.findall(plan)]
+    return (cost and float(cost.group(1)) or None,
+            rows and max(rows) or None,
+            filesort_re.search(plan) is not None)
+
+
+def judge(plan):
+    """
+    Returns the reason why the query plan exceeds the budget of the
+    guard, or ``None`` if it doesn't.
+    """
+    cost, rows, filesort = estimate(plan)
+    max_cost = settings.SORTER_GUARD_MAX_COST
+    if cost is not None and max_cost is not None and cost > max_cost:
+        return 'estimated cost %s exceeds %s' % (cost, max_cost)
+    max_rows = settings.SORTER_GUARD_MAX_ROWS
+    if rows is not None and max_rows is not None and rows > max_rows:
+        return 'estimated %s rows exceed %s' % (rows, max_rows)
+    if filesort and not settings.SORTER_GUARD_ALLOW_FILESORT:
+        return 'sorting without an index'
+    return None
+
+
+def guard_ordering(queryset, ordering):
+    """
+    Returns the given ordering if sorting the queryset by it is within
+    the budget of the guard, otherwise logs and drops it (returning an
+    empty ordering) or raises DisallowedOrdering.
+
+    The verdicts are cached by the SQL of the sorted queryset, without
+    its parameters.
+    """
+    sorted_queryset = queryset.order_by(*ordering)
+    try:
+        sql, params = sorted_queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return ordering
+    key = 'sorter:guard:%s' % hashlib.md5(
+        force_bytes('%s|%s' % (sorted_queryset.db, sql))).hexdigest()
+    cache = get_cache()
+    verdict = cache.get(key)
+    if verdict is None:
+        reason = judge(explain(sorted_queryset))
+        verdict = reason or ''
+        cache.set(key, verdict, settings.SORTER_GUARD_TIMEOUT)
+        if reason:
+            logger.warning("Dropped ordering %s of %s: %s",
+                           ','.join(map(force_text, ordering)), queryset.model._meta.label, reason)
+    if not verdict:
+        return ordering
+    if settings.SORTER_GUARD_ACTION == 'reject':
+        raise DisallowedOrdering("Ordering %s of %s is too expensive: %s" %
+                                 (','.join(map(force_text, ordering)), queryset.model._meta.label,
+                                  verdict))
+    return []
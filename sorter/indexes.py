@@ -0,0 +1,146 @@
+import hashlib
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.encoding import force_bytes
+from django.utils.six import string_types
+
+from sorter.conf import settings, CriteriaMatcher
+
+
+def get_models():
+    """
+    Returns the mapping of query names to models of the
+    SORTER_MODELS setting, resolving model labels.
+    """
+    result = {}
+    for name, model in settings.SORTER_MODELS.items():
+        if isinstance(model, string_types):
+            model = apps.get_model(model)
+        result[name] = model
+    return result
+
+
+def field_paths(model, depth=2, prefix=''):
+    """
+    Yields the ordering paths of the concrete fields of the given model,
+    following forward relations up to the given depth, together with the
+    model and field the path ends on.
+    """
+    for field in model._meta.concrete_fields:
+        path = prefix + field.name
+        yield path, model, field
+        if field.is_relation and depth > 0 and (field.many_to_one or
+                                                field.one_to_one):
+            for result in field_paths(field.related_model, depth - 1,
+                                      path + LOOKUP_SEP):
+                yield result
+
+
+def expand_criteria(model, criteria, depth=2):
+    """
+    Returns the ordering paths of the given model matching the given
+    allowed criteria, e.g. ``['author__*']``.
+    """
+    matcher = CriteriaMatcher(criteria)
+    return [path for path, _, _ in field_paths(model, depth)
+            if matcher(path) and path not in matcher.aliases]
+
+
+def resolve_field(model, path):
+    """
+    Returns the model and field the given ordering path ends on.
+    """
+    parts = path.split(LOOKUP_SEP)
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+        if model is None:
+            raise FieldDoesNotExist("'%s' isn't a relation" % part)
+    name = parts[-1]
+    if name == 'pk':
+        return model, model._meta.pk
+    try:
+        return model, model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # the attribute name of a foreign key, e.g. 'author_id'
+        for field in model._meta.concrete_fields:
+            if field.attname == name:
+                return model, field
+        raise
+
+
+def model_indexes(model):
+    """
+    Returns the indexes of the given model as lists of pairs of
+    field names and whether the column is sorted descending.
+    """
+    opts = model._meta
+    result = [[(field.name, False)] for field in opts.concrete_fields
+              if field.primary_key or field.unique or field.db_index]
+    for fields in list(opts.unique_together) + list(opts.index_together):
+        result.append([(name, False) for name in fields])
+    for index in getattr(opts, 'indexes', []):
+        result.append([(name, order == 'DESC')
+                       for name, order in index.fields_orders])
+    return result
+
+
+def is_indexed(model, ordering):
+    """
+    Returns whether the given ordering (a list of ordering values)
+    can be read from an index instead of sorting.
+
+    Orderings spanning more than one model can't use a single index.
+    """
+    columns = []
+    index_model = None
+    for value in ordering:
+        field_model, field = resolve_field(model, value.lstrip('-'))
+        if index_model not in (None, field_model):
+            return False
+        index_model = field_model
+        columns.append((field.name, value.startswith('-')))
+    names = [name for name, _ in columns]
+    for index in model_indexes(index_model):
+        if [name for name, _ in index[:len(columns)]] != names:
+            continue
+        # the index can be scanned forwards or backwards
+        matches = [descending == index_descending for (_, descending), (_, index_descending)
+                   in zip(columns, index)]
+        if all(matches) or not any(matches):
+            return True
+    return False
+
+
+def suggest_index(model, ordering):
+    """
+    Returns an Index supporting the given ordering, or ``None`` if
+    the ordering spans more than one model.
+    """
+    fields = []
+    index_model = None
+    for value in ordering:
+        field_model, field = resolve_field(model, value.lstrip('-'))
+        if index_model not in (None, field_model):
+            return None
+        index_model = field_model
+        fields.append(value.startswith('-') and '-' + field.name or field.name)
+    table = index_model._meta.db_table
+    digest = hashlib.md5(force_bytes('%s %s' % (table, fields))).hexdigest()[:6]
+    name = '%s_%s_%s_idx' % (table[:11].lstrip('_'), fields[0].lstrip('-')[:7], digest)
+    return index_model, models.Index(fields=fields, name=name)
+
+
+def unindexed_orderings(name, model, orderings=()):
+    """
+    Returns the orderings (lists of ordering values) of the allowed
+    criteria with the given query name and the given additional
+    multi-field orderings that aren't backed by an index.
+    """
+    criteria = (settings.SORTER_ALLOWED_CRITERIA or {}).get(name) or []
+    candidates = [[path] for path in expand_criteria(model, criteria)]
+    candidates.extend(list(ordering) for ordering in orderings)
+    return [ordering for ordering in candidates
+            if not is_indexed(model, ordering)]
@@ -0,0 +1,107 @@
+"""
+The sorter template tags as global functions of Jinja2 templates, e.g.
+with Django's Jinja2 template backend::
+
+    TEMPLATES = [
+        {
+            'BACKEND': 'django.template.backends.jinja2.Jinja2',
+            'APP_DIRS': True,
+            'OPTIONS': {
+                'extensions': ['sorter.jinja.SorterExtension'],
+            },
+        },
+    ]
+
+"""
+from jinja2.ext import Extension
+try:
+    from jinja2 import pass_context
+except ImportError:  # Jinja2 < 3.0
+    from jinja2 import contextfunction as pass_context
+from markupsafe import Markup
+
+from sorter.base import Sorter, sort_title, template_names
+from sorter.conf import settings
+
+
+def get_request(context):
+    request = context.get('request')
+    if not request:
+        raise RuntimeError("Couldn't find request in context")
+    return request
+
+
+@pass_context
+def sort(context, value, name=None, limit=None, keyset=None, cache=None):
+    """
+    {% set sorted_objects = sort(object_list, "objects") %}
+
+    {% set page = sort(object_list, "objects", keyset=20) %}
+
+    """
+    sorter = Sorter(get_request(context), name)
+    if sorter.presorted:
+        return value
+    return sorter.sort(value, limit=limit, keyset=keyset, cache=cache)
+
+
+@pass_context
+def sorturl(context, *orderings, **kwargs):
+    """
+    {{ sorturl("creation_date,-title", "title", name="objects") }}
+    """
+    sorter = Sorter(get_request(context), kwargs.get('name'))
+    return sorter.url(orderings)
+
+
+def render(context, template_name, label, orderings, kwargs):
+    sorter = Sorter(get_request(context), kwargs.get('name'))
+    query = sorter.next_query(orderings)
+    data = {
+        'with': sorter.name,
+        'name': sorter.name,
+        'by': orderings,
+        'rel': kwargs.get('rel'),
+        'class': kwargs.get('class_'),
+        'title': sort_title(query),
+        'label': label,
+        'url': sorter.state.sort_url(sorter.name, query),
+        'query': query,
+    }
+    if settings.SORTER_INHERIT_CONTEXT:
+        data.update(context.get_all())
+    # the environment keeps the compiled templates
+    template = context.environment.select_template(
+        template_names(template_name, sorter.name))
+    return Markup(template.render(data))
+
+
+@pass_context
+def sortlink(context, label, *orderings, **kwargs):
+    """
+    {{ sortlink(_("Creation and title"), "creation_date,-title", name="objects") }}
+    """
+    return render(context, 'sortlink', label, orderings, kwargs)
+
+
+@pass_context
+def sortform(context, label, *orderings, **kwargs):
+    """
+    {{ sortform(_("Creation and title"), "creation_date,-title", name="objects") }}
+    """
+    return render(context, 'sortform', label, orderings, kwargs)
+
+
+class SorterExtension(Extension):
+    """
+    Adds the ``sort``, ``sorturl``, ``sortlink`` and ``sortform``
+    global functions to the Jinja2 environment.
+    """
+    def __init__(self, environment):
+        super(SorterExtension, self).__init__(environment)
+        environment.globals.update({
+            'sort': sort,
+            'sorturl': sorturl,
+            'sortlink': sortlink,
+            'sortform': sortform,
+        })
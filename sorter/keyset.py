@@ -0,0 +1,311 @@
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Model, Q
+from django.utils.six import string_types
+
+CURSOR_SALT = 'sorter.keyset'
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Encodes datetimes and times with their microseconds, which the
+    Django encoder cuts down to milliseconds.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorEncoder, self).default(o)
+
+
+class CursorSerializer(object):
+    """
+    The serializer of the signed cursor tokens, able to handle dates,
+    decimals and the like.
+    """
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'),
+                          cls=CursorEncoder).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def cursor_name(name):
+    """
+    Returns the name of the querystring parameter holding the cursor
+    of the sorting with the given name.
+    """
+    return '%s_cursor' % name
+
+
+def expand_relation(model, field, depth=0):
+    """
+    Returns the ordering values the given ordering field of the given
+    model stands for. Like in the database, relations are sorted by the
+    ordering of the related model, or else by their stored primary key,
+    so that the keyset filter compares the same values.
+    """
+    descending = field.startswith('-')
+    parts = field.lstrip('-').split('__')
+    for index, part in enumerate(parts):
+        try:
+            model_field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return [field]
+        if not model_field.is_relation:
+            return [field]
+        if index < len(parts) - 1:
+            model = model_field.related_model
+            continue
+        if not (model_field.concrete and (model_field.many_to_one or model_field.one_to_one)):
+            return [field]
+        related_ordering = model_field.related_model._meta.ordering
+        if (not related_ordering or depth > 3 or
+                not all(isinstance(value, string_types) and value != '?'
+                        for value in related_ordering)):
+            parts[-1] = model_field.attname
+            return ['%s%s' % (descending and '-' or '', '__'.join(parts))]
+        expanded = []
+        for value in related_ordering:
+            for related in expand_relation(model_field.related_model, value, depth + 1):
+                related_descending = related.startswith('-') != descending
+                expanded.append('%s%s__%s' % (related_descending and '-' or '',
+                                              '__'.join(parts), related.lstrip('-')))
+        return expanded
+    return [field]
+
+
+def expand_ordering(model, ordering):
+    """
+    Returns the given ordering values of the given model with the
+    relations expanded to the fields they're sorted by.
+    """
+    return [expanded for field in ordering
+            for expanded in expand_relation(model, field)]
+
+
+def keyset_ordering(queryset, ordering):
+    """
+    Returns the given ordering, or the default ordering of the queryset,
+    with the relations expanded to the fields they're sorted by and the
+    primary key appended as a unique tiebreaker.
+    """
+    ordering = list(ordering)
+    if not ordering and queryset.query.default_ordering:
+        ordering = [field for field in (queryset.query.order_by or
+                                        queryset.model._meta.ordering)
+                    if isinstance(field, string_types)]
+    ordering = expand_ordering(queryset.model, ordering)
+    pk_names = ('pk', queryset.model._meta.pk.name)
+    if not any(field.lstrip('-') in pk_names for field in ordering):
+        ordering.append('pk')
+    return ordering
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-%s' % field
+            for field in ordering]
+
+
+def get_value(obj, field):
+    """
+    Returns the value of the given (possibly ``__`` separated) ordering
+    field of the given object, using the primary key of related objects.
+    """
+    for part in field.lstrip('-').split('__'):
+        if obj is None:
+            break
+        obj = getattr(obj, part)
+    if isinstance(obj, Model):
+        return obj.pk
+    return obj
+
+
+def nullable(model, field):
+    """
+    Returns whether the given (possibly ``__`` separated) ordering field
+    of the given model may be ``NULL``, e.g. because of a nullable
+    relation on the way. Unknown fields like annotations may be.
+    """
+    for part in field.lstrip('-').split('__'):
+        if model is None:
+            return True
+        try:
+            model_field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return True
+        if getattr(model_field, 'null', True):
+            return True
+        model = model_field.related_model
+    return False
+
+
+def following(field, value, larger, nulls_largest=False, null=True):
+    """
+    Returns the filter of the values of the given field following the
+    given value when moving towards larger (or smaller) values, or
+    ``None`` if no value follows it.
+
+    Depending on the database ``NULL`` is either the smallest or the
+    largest value. Fields that can't be ``NULL`` don't need to check.
+    """
+    if value is None:
+        if larger == nulls_largest:
+            return None
+        return Q(**{'%s__isnull' % field: False})
+    condition = Q(**{'%s__%s' % (field, larger and 'gt' or 'lt'): value})
+    if null and larger == nulls_largest:
+        condition |= Q(**{'%s__isnull' % field: True})
+    return condition
+
+
+def keyset_filter(ordering, values, previous=False, nulls_largest=False, model=None):
+    """
+    Returns the filter for the rows following (or preceding) the row with
+    the given values, e.g. for ``['a', '-b', 'pk']``::
+
+        a > A OR (a = A AND b < B) OR (a = A AND b = B AND pk > PK)
+
+    ``NULL`` values are sorted before all other values, or after them
+    if ``nulls_largest`` is true, like in databases such as PostgreSQL.
+    The fields of the given model that can't be ``NULL`` aren't checked.
+    """
+    conditions = []
+    equal = {}
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        field = field.lstrip('-')
+        null = model is None or nullable(model, field)
+        condition = following(field, value, descending == previous, nulls_largest, null)
+        if condition is not None:
+            conditions.append(Q(**equal) & condition if equal else condition)
+        if value is None:
+            equal['%s__isnull' % field] = True
+        else:
+            equal[field] = value
+    if not conditions:
+        return Q(pk__in=[])
+    return reduce(operator.or_, conditions)
+
+
+def encode_cursor(direction, ordering, obj):
+    """
+    Returns the opaque cursor token of the given object, valid for
+    the given ordering and direction only.
+    """
+    values = [get_value(obj, field) for field in ordering]
+    return signing.dumps([direction, ordering, values], salt=CURSOR_SALT,
+                         serializer=CursorSerializer, compress=True)
+
+
+def decode_cursor(token, ordering):
+    """
+    Returns the direction and the values of the given cursor token or
+    ``(None, None)`` if it's invalid or was created for another ordering.
+    """
+    if not token:
+        return None, None
+    try:
+        direction, cursor_ordering, values = signing.loads(
+            token, salt=CURSOR_SALT, serializer=CursorSerializer)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None, None
+    if (direction not in (NEXT, PREVIOUS) or cursor_ordering != ordering or
+            len(values) != len(ordering)):
+        return None, None
+    return direction, values
+
+
+class KeysetPage(object):
+    """
+    A page of a keyset paginated queryset. Iterating over it
+    returns the objects of the page.
+    """
+    def __init__(self, object_list, has_next=False, has_previous=False,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_url = self.previous_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return '<KeysetPage of %s objects>' % len(self)
+
+
+def paginate(queryset, ordering, cursor=None, per_page=20):
+    """
+    Returns the :class:`KeysetPage` of the queryset sorted by the given
+    ordering that follows (or precedes) the given cursor token.
+
+    Instead of an offset the page is selected by filtering on the sort
+    keys of the last (or first) row of the previous page, so that any
+    page costs the same as the first one with a matching index.
+    """
+    ordering = keyset_ordering(queryset, ordering)
+    direction, values = decode_cursor(cursor, ordering)
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    queryset = queryset.order_by(*ordering)
+    if direction == PREVIOUS:
+        queryset = (queryset.filter(keyset_filter(ordering, values, True, nulls_largest,
+                                                  queryset.model))
+                            .order_by(*reverse_ordering(ordering)))
+    elif direction == NEXT:
+        queryset = queryset.filter(keyset_filter(ordering, values, False, nulls_largest,
+                                                 queryset.model))
+
+    object_list = list(queryset[:per_page + 1])
+    more = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    if direction == PREVIOUS:
+        object_list.reverse()
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, direction == NEXT
+
+    page = KeysetPage(object_list, has_next, has_previous)
+    if object_list:
+        if has_next:
+            page.next_cursor = encode_cursor(NEXT, ordering, object_list[-1])
+        if has_previous:
+            page.previous_cursor = encode_cursor(PREVIOUS, ordering,
+                                                 object_list[0])
+    return page
+
+
+def batches(queryset, ordering, size=1000):
+    """
+    Yields lists of up to ``size`` objects of the queryset sorted by the
+    given ordering, each selected by the sort keys of the previous batch
+    instead of an offset, so only one batch is held in memory at a time.
+    """
+    ordering = keyset_ordering(queryset, ordering)
+    nulls_largest = connections[queryset.db].features.nulls_order_largest
+    queryset = queryset.order_by(*ordering)
+    values = None
+    while True:
+        batch = queryset
+        if values is not None:
+            batch = batch.filter(keyset_filter(ordering, values, False, nulls_largest,
+                                               queryset.model))
+        batch = list(batch[:size])
+        if batch:
+            yield batch
+        if len(batch) < size:
+            return
+        values = [get_value(batch[-1], field) for field in ordering]
@@ -0,0 +1,62 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+
+from sorter.indexes import get_models, suggest_index, unindexed_orderings
+
+
+class Command(BaseCommand):
+    help = ("Reports the allowed sort criteria of the models in the "
+            "SORTER_MODELS setting that aren't backed by a database index.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*', metavar='NAME',
+            help="Only report the given query names.")
+        parser.add_argument(
+            '--ordering', action='append', default=[], dest='orderings',
+            metavar='NAME=ORDERING',
+            help="Also check a multi-field ordering of a query name, "
+                 "e.g. 'sort_posts=-created,title'. Can be used multiple times.")
+        parser.add_argument(
+            '--suggest', action='store_true', dest='suggest', default=False,
+            help="Print Index definitions for the unindexed orderings.")
+
+    def handle(self, *names, **options):
+        names = options.get('names') or names
+        try:
+            models = get_models()
+        except (LookupError, ValueError) as exc:
+            raise CommandError("The SORTER_MODELS setting is invalid: %s" % exc)
+        orderings = {}
+        for value in options['orderings']:
+            name, sep, ordering = value.partition('=')
+            if not sep or not ordering:
+                raise CommandError("Invalid ordering '%s', use NAME=ORDERING." % value)
+            orderings.setdefault(name, []).append(ordering.split(','))
+        for name in list(names) + list(orderings):
+            if name not in models:
+                raise CommandError("No model configured for '%s' in the "
+                                   "SORTER_MODELS setting." % name)
+
+        suggestions = []
+        for name, model in sorted(models.items()):
+            if names and name not in names:
+                continue
+            try:
+                unindexed = unindexed_orderings(name, model, orderings.get(name, ()))
+            except FieldDoesNotExist as exc:
+                raise CommandError("The criteria of '%s' are invalid: %s" % (name, exc))
+            self.stdout.write("%s (%s)" % (name, model._meta.label))
+            if not unindexed:
+                self.stdout.write("  all orderings are indexed")
+            for ordering in unindexed:
+                self.stdout.write("  %s: no index" % ','.join(ordering))
+                suggestion = suggest_index(model, ordering)
+                if suggestion is not None and suggestion not in suggestions:
+                    suggestions.append(suggestion)
+
+        if options['suggest'] and suggestions:
+            self.stdout.write("\nSuggested indexes:")
+            for model, index in suggestions:
+                self.stdout.write("  %s: models.Index(fields=%r, name=%r)," %
+                                  (model._meta.label, index.fields, index.name))
@@ -0,0 +1,55 @@
+from django.http import HttpResponsePermanentRedirect
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # Django < 1.10
+    MiddlewareMixin = object
+
+from sorter.conf import get_matcher
+from sorter.state import SortState, get_state
+from sorter.timing import TimingCollector
+
+
+class SortStateMiddleware(MiddlewareMixin):
+    """
+    Attaches the sort state to every request up front, instead of
+    letting the first sorter template tag of a page do it.
+    """
+    def process_request(self, request):
+        request.sort_state = SortState(request)
+
+
+class TimingMiddleware(MiddlewareMixin):
+    """
+    Collects the timings of the sorter template tags of each request
+    (if the SORTER_TIMING setting is enabled) and adds them to the
+    response as a ``Server-Timing`` header.
+    """
+    def process_request(self, request):
+        request.sorter_timings = TimingCollector()
+
+    def process_response(self, request, response):
+        collector = getattr(request, 'sorter_timings', None)
+        if collector is not None and collector.tags:
+            header = collector.header()
+            if response.has_header('Server-Timing'):
+                header = '%s, %s' % (response['Server-Timing'], header)
+            response['Server-Timing'] = header
+        return response
+
+
+class CanonicalSortMiddleware(MiddlewareMixin):
+    """
+    Permanently redirects GET requests with sorting queries that aren't
+    in canonical form, e.g. ``?sort=a,a&page=2``, to the canonical URL,
+    e.g. ``?page=2&sort=a``, so that each sorted page has a single URL.
+    """
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if not any(get_matcher(key) is not None for key in request.GET):
+            return None
+        state = get_state(request)
+        url = state.canonical_url()
+        if url != state.url:
+            return HttpResponsePermanentRedirect(url)
+        return None
@@ -0,0 +1,37 @@
+from django.db import NotSupportedError, connections
+from django.db.models import OuterRef, Prefetch, Subquery
+
+
+def partition_top(queryset, field, ordering, limit):
+    """
+    Returns the given queryset limited to the first ``limit`` objects per
+    value of the given field (e.g. the foreign key to the parent objects)
+    when sorted by the given ordering, in a single query.
+
+    The primary keys of each partition are selected with a correlated
+    subquery using ``LIMIT``, which some databases, e.g. MySQL, don't
+    support.
+    """
+    features = connections[queryset.db].features
+    if not getattr(features, 'allow_sliced_subqueries_with_in',
+                   getattr(features, 'allow_sliced_subqueries', True)):
+        raise NotSupportedError(
+            "The %s database doesn't support limited subqueries, which are "
+            "needed to select the top objects per parent." % features.connection.vendor)
+    pks = (queryset.filter(**{field: OuterRef(field)})
+           .order_by(*ordering).values('pk')[:limit])
+    return queryset.filter(pk__in=Subquery(pks)).order_by(*ordering)
+
+
+def top_prefetch(lookup, queryset, field, ordering, limit, to_attr=None):
+    """
+    Returns a ``Prefetch`` object for ``prefetch_related()`` fetching the
+    first ``limit`` related objects of each parent object sorted by the
+    given ordering, e.g. the five newest comments of each post::
+
+        Post.objects.prefetch_related(
+            top_prefetch('comments', Comment.objects.all(), 'post', ['-created'], 5))
+
+    """
+    return Prefetch(lookup, partition_top(queryset, field, ordering, limit),
+                    to_attr=to_attr)
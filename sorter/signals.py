@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after each sorter template tag was rendered if the SORTER_TIMING
+# setting is enabled, with the durations of the tag's phases in seconds.
+tag_timed = Signal(providing_args=['tag', 'name', 'links', 'timings',
+                                   'total', 'request'])
@@ -0,0 +1,161 @@
+from urlobject import URLObject
+from urlobject.query_string import qs_encode
+
+from django.utils.functional import cached_property
+
+from sorter.conf import settings, get_matcher
+from sorter.keyset import cursor_name
+from sorter.utils import normalize_ordering
+
+
+class SortState(object):
+    """
+    Holds the sorting related state of a single request, so that all
+    template tags rendered for it share the parsed querystring, the
+    validated orderings and the current URL.
+    """
+    def __init__(self, request):
+        self.request = request
+        self.orderings = {}
+        self.url_prefixes = {}
+        # the conditional GET validators of each sorting
+        self.validators = {}
+        # the names of the sortings already applied, e.g. in a view
+        self.presorted = set()
+        # the timer of the currently rendered tag, if timing is enabled
+        self.timer = None
+
+    @cached_property
+    def url(self):
+        """
+        The URLObject of the current request path, including the querystring.
+        """
+        return URLObject(self.request.get_full_path())
+
+    @cached_property
+    def queries(self):
+        """
+        The queries of the current URL, not using sequences here
+        since the order of sorting arguments matter.
+        """
+        return self.url.query.dict
+
+    def url_prefix(self, name):
+        """
+        Returns the current URL without the given query (and its keyset
+        cursor), already encoded and ready to have the query appended.
+        """
+        try:
+            return self.url_prefixes[name]
+        except KeyError:
+            pass
+        url = self.url.del_query_params([name, cursor_name(name)])
+        prefix = u'%s%s%s=' % (url, url.query and '&' or '?', qs_encode(name))
+        self.url_prefixes[name] = prefix
+        return prefix
+
+    def sort_url(self, name, query):
+        """
+        Returns the current URL with the given query set, the same as
+        ``url.set_query_param(name, query)`` but only encoding the query,
+        or the canonical URL if the SORTER_CANONICAL setting is enabled.
+        """
+        if settings.SORTER_CANONICAL:
+            if get_matcher(name) is None:  # e.g. the cursor of a sorting
+                return self.canonical_url({name: [query]})
+            return self.canonical_url(
+                {name: [self.canonical_query(name, query)], cursor_name(name): []})
+        return URLObject(self.url_prefix(name) + qs_encode(query))
+
+    def current_query(self, name):
+        """
+        Returns the query of the given name of the sorting found in the
+        querystring, or its default ordering.
+        """
+        query = self.queries.get(name)
+        if query is None:
+            query = settings.SORTER_DEFAULT_ORDERINGS.get(name)
+        return query
+
+    def clean(self, name, query):
+        """
+        Returns the list of ordering values of the given query that are
+        allowed for the given name of the sorting, without duplicates.
+        """
+        matcher = get_matcher(name)
+        if matcher is None:
+            return []
+        return normalize_ordering(
+            [sort_field for sort_field in query.split(',')
+             if matcher(sort_field.lstrip('-'))],
+            settings.SORTER_MAX_CRITERIA)
+
+    def ordering(self, name):
+        """
+        Returns the list of validated ordering values for the given
+        name of the sorting, the same list each time it's called.
+        """
+        try:
+            return self.orderings[name]
+        except KeyError:
+            pass
+        result = self.orderings[name] = []
+        try:
+            query = self.request.GET[name]
+        except (KeyError, ValueError, TypeError):
+            query = settings.SORTER_DEFAULT_ORDERINGS.get(name)
+            if query is None:
+                return result
+        result.extend(self.clean(name, query))
+        return result
+
+    def canonical_query(self, name, query):
+        """
+        Returns the canonical form of the given query of the sorting with
+        the given name, or an empty string for its default ordering.
+        """
+        query = ','.join(self.clean(name, query))
+        if query == ','.join(self.clean(
+                name, settings.SORTER_DEFAULT_ORDERINGS.get(name, ''))):
+            return ''
+        return query
+
+    @cached_property
+    def canonical_params(self):
+        """
+        The querystring parameters of the current URL by name, with the
+        queries of the sortings in canonical form.
+        """
+        params = {}
+        for key, values in self.request.GET.lists():
+            if get_matcher(key) is not None:
+                values = [self.canonical_query(key, values[-1])]
+            params[key] = values
+        return params
+
+    def canonical_url(self, params=None):
+        """
+        Returns the canonical form of the current URL, optionally with the
+        given parameters replaced: sorted by name, with the queries of the
+        sortings normalized and the default orderings dropped.
+        """
+        params = dict(self.canonical_params, **(params or {}))
+        query = '&'.join(
+            '%s=%s' % (qs_encode(key), qs_encode(value))
+            for key in sorted(params) for value in params[key]
+            if value or get_matcher(key) is None)
+        if not query:
+            return self.url.without_query()
+        return self.url.with_query(query)
+
+
+def get_state(request):
+    """
+    Returns the sort state of the given request, attaching it to the
+    request if neither the middleware nor another tag has done so.
+    """
+    try:
+        return request.sort_state
+    except AttributeError:
+        state = request.sort_state = SortState(request)
+        return state
@@ -1,22 +1,96 @@
-from fnmatch import fnmatch
-from urlobject import URLObject
+import hashlib
 
 from django import template
-from django.template import TemplateSyntaxError
-from django.template.loader import render_to_string
+from django.core.signals import setting_changed
+from django.template import Context, TemplateSyntaxError, Variable
+from django.template.base import FilterExpression
+from django.template.loader import select_template
+from django.utils.encoding import force_bytes
+from django.utils.safestring import mark_safe
 from django.utils.six import string_types
-from django.utils.translation import ugettext as _
-from django.utils.text import get_text_list
+from django.utils.translation import get_language
 
 import ttag
 
-from sorter.conf import settings
+from sorter.base import Sorter, query_name, sort_title, template_names
 from sorter.utils import cycle_pairs
+from sorter.cache import get_cache
+from sorter.conf import settings
+from sorter.signals import tag_timed
+from sorter.state import get_state
+from sorter.timing import Timer
 
 register = template.Library()
 
+# The compiled link and form templates, by template and query name
+templates = {}
+
+
+def is_constant(value):
+    """
+    Returns whether the given parsed argument is a literal, e.g. ``"title"``,
+    that resolves to the same value for every context.
+    """
+    if isinstance(value, FilterExpression):
+        return not isinstance(value.var, Variable) and not value.filters
+    if isinstance(value, (list, tuple)):
+        return all(is_constant(item) for item in value)
+    return not isinstance(value, Variable)
+
+
+def clear_templates(setting, **kwargs):
+    if setting in ('TEMPLATES', 'DEBUG'):
+        templates.clear()
+
+
+setting_changed.connect(clear_templates)
+
 
 class SorterAsTag(ttag.helpers.AsTag):
+    # the number of links rendered by each invocation of the tag
+    links = 0
+
+    def __init__(self, parser, token):
+        super(SorterAsTag, self).__init__(parser, token)
+        # resolve and clean the literal arguments only once
+        self.constants = {}
+        for name, value in self._vars.items():
+            if is_constant(value):
+                self.constants[name] = self.resolve_arg(name, value, Context())
+
+    def resolve_arg(self, name, value, context):
+        arg = self._meta.args[name]
+        value = arg.clean(arg.resolve(value, context))
+        tag_arg_clean = getattr(self, 'clean_%s' % arg.name, None)
+        if tag_arg_clean is not None:
+            value = tag_arg_clean(value)
+        return value
+
+    def resolve(self, context):
+        """
+        Resolves the arguments that aren't literals and cleans the data.
+        """
+        data = dict(self.constants)
+        for name, value in self._vars.items():
+            if name not in data:
+                data[name] = self.resolve_arg(name, value, context)
+        return self.clean(data, context)
+
+    def render(self, context):
+        if not settings.SORTER_TIMING or not context.get('request'):
+            return super(SorterAsTag, self).render(context)
+        state = get_state(context['request'])
+        # tags may be nested in the label of block tags
+        previous, timer = state.timer, Timer()
+        state.timer = timer
+        try:
+            return super(SorterAsTag, self).render(context)
+        finally:
+            state.timer = previous
+            tag_timed.send(sender=type(self), tag=self._meta.name,
+                           name=timer.name, links=self.links,
+                           timings=timer.timings, total=timer.total,
+                           request=state.request)
 
     def clean(self, data, context):
         """
@@ -27,6 +101,10 @@ class SorterAsTag(ttag.helpers.AsTag):
         if not request:
             raise TemplateSyntaxError("Couldn't find request in context: %s" %
                                       context)
+        timer = get_state(request).timer
+        if timer is not None:
+            timer.name = data.get('with')
+            timer.lap('resolve')
         return super(SorterAsTag, self).clean(data, context)
 
     def clean_with(self, value):
@@ -35,29 +113,47 @@ class SorterAsTag(ttag.helpers.AsTag):
         """
         if not isinstance(value, string_types):
             raise TemplateSyntaxError("Value '%s' is not a string" % value)
-        # in case the value equals the default query name
-        # or it already has the default query name prefixed
-        if (value == settings.SORTER_DEFAULT_QUERY_NAME or
-                value.startswith(settings.SORTER_DEFAULT_QUERY_NAME)):
-            return value
-        return '%s_%s' % (settings.SORTER_DEFAULT_QUERY_NAME, value)
+        return query_name(value)
 
 
 class Sort(SorterAsTag):
     """
-    {% sort queryset [with NAME] as VARIABLE %}
+    {% sort queryset [with NAME] [limit LIMIT] [keyset PER_PAGE] [cache TIMEOUT] as VARIABLE %}
 
     {% sort object_list with "objects" as sorted_objects %}
 
+    {% sort object_list with "objects" limit 10 as top_objects %}
+
+    {% sort object_list with "objects" keyset 20 as page %}
+
+    {% sort object_list with "objects" limit 100 cache 300 as sorted_objects %}
+
     """
     data = ttag.Arg()
     with_ = ttag.Arg(named=True, required=False, default=settings.SORTER_DEFAULT_QUERY_NAME)
+    limit = ttag.IntegerArg(named=True, required=False)
+    keyset = ttag.IntegerArg(named=True, required=False)
+    cache = ttag.IntegerArg(named=True, required=False)
+
+    def __init__(self, parser, token):
+        super(Sort, self).__init__(parser, token)
+        if 'cache' in self._vars and 'limit' not in self._vars:
+            raise TemplateSyntaxError("The 'cache' argument of the sort tag "
+                                      "needs a 'limit' argument")
 
     def as_value(self, data, context):
-        value = data['data']
+        sorter = Sorter(context['request'], data['with'])
+        if sorter.presorted:
+            return data['data']
         ordering = self.ordering(context, data['with'])
-        if ordering:
-            return value.order_by(*ordering)
+        timer = sorter.state.timer
+        if timer is not None:
+            timer.lap('validate')
+        value = sorter.sort(data['data'], limit=data.get('limit'),
+                            keyset=data.get('keyset'),
+                            cache=data.get('cache'), ordering=ordering)
+        if timer is not None:
+            timer.lap('sort')
         return value
 
     def ordering(self, context, name):
@@ -65,19 +161,7 @@ class Sort(SorterAsTag):
         Given the template context and the name of the sorting
         should return a list of ordering values.
         """
-        try:
-            sort_fields = context['request'].GET[name].split(',')
-        except (KeyError, ValueError, TypeError):
-            return []
-        result = []
-        allowed_criteria = settings.SORTER_ALLOWED_CRITERIA.get(name)
-        if allowed_criteria is None:
-            return result
-        for sort_field in sort_fields:
-            for criteria in allowed_criteria:
-                if fnmatch(sort_field.lstrip('-'), criteria):
-                    result.append(sort_field)
-        return result
+        return Sorter(context['request'], name).ordering
 
 
 class TemplateAsTagOptions(ttag.helpers.as_tag.AsTagOptions):
@@ -101,6 +185,7 @@ class SortURL(SorterAsTag):
 
     """
     __metaclass__ = TemplateAsTagMetaclass
+    links = 1
 
     with_ = ttag.Arg(required=False, named=True, default=settings.SORTER_DEFAULT_QUERY_NAME)
     rel = ttag.Arg(required=False, named=True)
@@ -112,15 +197,34 @@ class SortURL(SorterAsTag):
         template_name = 'sorturl'
         name = 'sorturl'
 
+    def __init__(self, parser, token):
+        super(SortURL, self).__init__(parser, token)
+        self.next_queries = self.template_names = None
+        # the titles of the literal orderings by query and language
+        self.titles = {}
+        orderings = self.constants.get('by')
+        if orderings:
+            self.next_queries = {}
+            for current, next in cycle_pairs(orderings):
+                self.next_queries.setdefault(current, next)
+        if 'with' in self.constants:
+            self.template_names = self.using(self.constants)
+
     def as_value(self, data, context):
-        # The queries of the current URL, not using sequences here
-        # since the order of sorting arguments matter
-        url = URLObject(context['request'].get_full_path())
-        queries = url.query.dict
+        state = get_state(context['request'])
+        timer = state.timer
 
         name, orderings = data['with'], data['by']
-        query = self.find_query(queries.get(name), orderings, orderings[0])
-        url = url.set_query_param(name, query)
+        current = state.current_query(name)
+        if self.next_queries is not None:
+            query = self.next_queries.get(current, orderings[0])
+        else:
+            query = self.find_query(current, orderings, orderings[0])
+        if timer is not None:
+            timer.lap('query')
+        url = state.sort_url(name, query)
+        if timer is not None:
+            timer.lap('url')
 
         # If this isn't a block tag we probably only want the URL
         if not self._meta.block:
@@ -130,24 +234,15 @@ class SortURL(SorterAsTag):
         if not label.strip():
             raise TemplateSyntaxError("No label was specified")
 
-        parts = []
-        for part in query.split(','):
-            part = part.strip()
-            if part.startswith('-'):
-                part = part.lstrip('-')
-                # Translators: Used in title of descending sort fields
-                text = _("'%(sort_field)s' (desc)")
-            else:
-                # Translators: Used in title of ascending sort fields
-                text = _("'%(sort_field)s' (asc)")
-            parts.append(text % {'sort_field': part})
-        # Translators: Used for the link/form input title excluding the sort fields
-        title = (_('Sort by: %(sort_fields)s') %
-                 {'sort_fields': get_text_list(parts, _('and'))})
+        title = self.title(query)
 
         extra_context = dict(data, title=title, label=label, url=url, query=query)
-        extra_context.update(context.flatten())
-        return render_to_string(self.using(data), extra_context)
+        if settings.SORTER_INHERIT_CONTEXT:
+            extra_context.update(context.flatten())
+        result = self.get_template(data).render(extra_context)
+        if timer is not None:
+            timer.lap('render')
+        return result
 
     def find_query(self, wanted, orderings, default):
         """
@@ -155,10 +250,36 @@ class SortURL(SorterAsTag):
         found in the request's querystring returns the next in line,
         or falls back to the given default.
         """
-        for current, next in cycle_pairs(orderings):
-            if current == wanted:
-                return next
-        return default
+        return Sorter.find_query(wanted, orderings, default)
+
+    def title(self, query):
+        """
+        Returns the title of the given query, only translating it once
+        per language if the orderings are literals.
+        """
+        if self.next_queries is None:
+            return sort_title(query)
+        key = (query, get_language())
+        try:
+            return self.titles[key]
+        except KeyError:
+            title = self.titles[key] = sort_title(query)
+            return title
+
+    def get_template(self, data):
+        """
+        Returns the compiled template to render, only looking it
+        up once per query name unless in debug mode.
+        """
+        key = (self._meta.template_name, data.get('with'))
+        try:
+            return templates[key]
+        except KeyError:
+            pass
+        template = select_template(self.template_names or self.using(data))
+        if not settings.DEBUG:
+            templates[key] = template
+        return template
 
     def using(self, data):
         """
@@ -166,11 +287,7 @@ class SortURL(SorterAsTag):
         but uses 'sorter/sorturl_NAME.html' additionally if the
         'with' argument is given.
         """
-        name = data.get('with')
-        template_names = [self._meta.template_name]
-        if name and name != settings.SORTER_DEFAULT_QUERY_NAME:
-            template_names.append(u'%s_%s' % (self._meta.template_name, name))
-        return [u"sorter/%s.html" % name for name in template_names]
+        return template_names(self._meta.template_name, data.get('with'))
 
 
 class Sortlink(SortURL):
@@ -211,7 +328,77 @@ class Sortform(SortURL):
         template_name = 'sortform'
 
 
+class SortCache(SorterAsTag):
+    """
+    Caches the rendered content, e.g. a toolbar of sort links, by the
+    inputs of the sorting with the given name: the current query, the
+    path and the other querystring parameters, the active language and
+    the orderings and templates of the nested sort links.
+
+    {% sortcache FRAGMENT [with NAME] [timeout TIMEOUT] %}
+        ..
+    {% endsortcache %}
+
+    {% sortcache "toolbar" with "objects" %}
+        {% sortlink with "objects" by "title" %}{% trans "Title" %}{% endsortlink %}
+        {% sortlink with "objects" by "-date" %}{% trans "Date" %}{% endsortlink %}
+    {% endsortcache %}
+
+    """
+    fragment = ttag.Arg()
+    with_ = ttag.Arg(named=True, required=False, default=settings.SORTER_DEFAULT_QUERY_NAME)
+    timeout = ttag.IntegerArg(named=True, required=False)
+
+    class Meta:
+        block = True
+        as_required = False
+        name = 'sortcache'
+
+    def __init__(self, parser, token):
+        super(SortCache, self).__init__(parser, token)
+        # the content also depends on the orderings and templates of the
+        # nested tags, their literal arguments are collected only once
+        self.link_nodes = self.nodelist.get_nodes_by_type(SortURL)
+        self.signature = ['%s%r' % (node._meta.template_name, sorted(node.constants.items()))
+                          for node in self.link_nodes]
+
+    def links_signature(self, context):
+        """
+        Returns the signature of the nested tags: their literal arguments,
+        the values of the other ones and the templates they render.
+        """
+        signature = list(self.signature)
+        for node in self.link_nodes:
+            data = dict(node.constants)
+            for name, value in node._vars.items():
+                if name not in data:
+                    data[name] = node.resolve_arg(name, value, context)
+                    signature.append('%s=%r' % (name, data[name]))
+            if node._meta.block:
+                origin = getattr(node.get_template(data), 'origin', None)
+                signature.append(getattr(origin, 'name', ''))
+        return '|'.join(signature)
+
+    def as_value(self, data, context):
+        state = get_state(context['request'])
+        name = data['with']
+        key = 'sorter:fragment:%s' % hashlib.md5(force_bytes('%s|%s|%s|%s|%s|%s' % (
+            data['fragment'], name, state.queries.get(name, ''),
+            state.url_prefix(name), get_language(),
+            self.links_signature(context)))).hexdigest()
+        cache = get_cache()
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            timeout = data.get('timeout')
+            if timeout is None:
+                timeout = settings.SORTER_FRAGMENT_TIMEOUT
+            cache.set(key, value, timeout)
+        return mark_safe(value)
+
+
 register.tag(Sort)
 register.tag(SortURL)
 register.tag(Sortlink)
 register.tag(Sortform)
+register.tag(SortCache)
@@ -1,14 +1,47 @@
-from django.contrib.auth.models import User
+import json
+from datetime import datetime
+from unittest import skipIf
+
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.admin.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
 from django.http import HttpResponse
 from django.template import Library, Template, Context, TemplateSyntaxError
-from django.test import TestCase
+from django.core.management import call_command, CommandError
+from django.db import NotSupportedError, connection
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from django.views.generic import ListView
+from django.utils import translation
+from django.utils.six import StringIO
 
 from model_mommy import mommy
+try:
+    from django.template.backends.jinja2 import Jinja2
+except ImportError:  # Jinja2 isn't installed
+    Jinja2 = None
 
-from sorter.conf import settings
-from sorter.utils import cycle_pairs
+from sorter.base import Sorter
+from sorter import cache
+from sorter.cache import cached_ordering, get_cache
+from sorter.checks import check_indexes
+from sorter.conf import settings, get_matcher, CriteriaMatcher
+from sorter.decorators import sorted_condition
+from sorter.export import export_response
+from sorter.guard import DisallowedOrdering, estimate, guard_ordering
+from sorter.indexes import expand_criteria, is_indexed, suggest_index
+from sorter.keyset import batches, keyset_filter, keyset_ordering, nullable, paginate
+from sorter.middleware import CanonicalSortMiddleware, SortStateMiddleware, TimingMiddleware
+from sorter.prefetch import partition_top
+from sorter.signals import tag_timed
+from sorter.state import SortState, get_state
+from sorter.templatetags import sorter_tags
+from sorter.utils import (cycle_pairs, normalize_ordering, related_paths,
+                          resolve_ordering, sort_objects)
+from sorter.views import SortedExportView, SortedListMixin
 
 register = Library()
 
@@ -156,6 +189,888 @@ class SortTests(SorterTestCase):
             settings.SORTER_ALLOWED_CRITERIA = old_setting
 
 
+class Item(object):
+
+    def __init__(self, pk, title, parent=None):
+        self.pk, self.title, self.parent = pk, title, parent
+
+
+class SortObjectsTests(SorterTestCase):
+
+    def test_objects(self):
+        parent_a, parent_b = Item(10, 'a'), Item(11, 'b')
+        items = [Item(1, 'x', parent_b), Item(2, 'y', parent_a),
+                 Item(3, 'x', None), Item(4, None, parent_a)]
+        self.assertEqual([item.pk for item in sort_objects(items, ['title', '-pk'])],
+                         [4, 3, 1, 2])
+        self.assertEqual([item.pk for item in sort_objects(items, ['-title'])],
+                         [2, 1, 3, 4])
+        self.assertEqual([item.pk for item in sort_objects(items, ['parent__title', '-title'])],
+                         [3, 2, 4, 1])
+        self.assertEqual([item.pk for item in sort_objects(iter(items), [])],
+                         [1, 2, 3, 4])
+
+    def test_nulls_largest(self):
+        items = [Item(1, 'x'), Item(2, None), Item(3, 'a')]
+        self.assertEqual([item.pk for item in sort_objects(items, ['title'], nulls_largest=True)],
+                         [3, 1, 2])
+        self.assertEqual([item.pk for item in sort_objects(items, ['-title'], 2, True)],
+                         [2, 1])
+
+    def test_prefetched(self):
+        users = [mommy.make(User) for i in range(2)]
+        for user in users * 2:
+            mommy.make(LogEntry, user=user)
+        template = Template("""{% for user in users %}"""
+                            """{% sort user.logentry_set.all with "objects" as entries %}"""
+                            """{{ entries|sorter_tests_pks }};{% endfor %}""")
+        users = User.objects.filter(pk__in=[user.pk for user in users]).order_by('pk')
+        expected = ''.join('%s;' % '.'.join(str(pk) for pk in sorted(
+            user.logentry_set.values_list('pk', flat=True), reverse=True))
+            for user in users)
+        request = self.rf.get('/', {'sort_objects': '-id'})
+        with self.assertNumQueries(2):
+            result = template.render(Context({
+                'request': request, 'users': users.prefetch_related('logentry_set')}))
+        self.assertEqual(result, expected)
+        # an evaluated queryset isn't queried again either
+        entries = LogEntry.objects.order_by('id')
+        list(entries)
+        sorter = Sorter(request, 'objects')
+        with self.assertNumQueries(0):
+            self.assertEqual([entry.pk for entry in sorter.sort(entries, limit=2)],
+                             [entry.pk for entry in entries][::-1][:2])
+            self.assertEqual([entry.pk for entry in sorter.sort(entries, ordering=['user'])],
+                             [entry.pk for entry in sorted(entries, key=lambda e: (e.user_id, 0))])
+
+    def test_evaluated_values(self):
+        users = [mommy.make(User, username=name) for name in ('b', 'c', 'a')]
+        request = self.rf.get('/', {'sort_objects': '-username'})
+        sorter = Sorter(request, 'objects')
+        queryset = User.objects.filter(pk__in=[user.pk for user in users])
+        for rows in (queryset.values_list('username', flat=True),
+                     queryset.values_list('username'), queryset.values('pk')):
+            list(rows)
+            with self.assertNumQueries(1):
+                result = list(sorter.sort(rows))
+            self.assertEqual(result, list(rows.order_by('-username')))
+
+    def test_evaluated_relations(self):
+        Through = User.user_permissions.through
+        user = mommy.make(User)
+        # the primary keys of the permissions don't follow their ordering
+        user.user_permissions.set(list(Permission.objects.order_by('-pk')[:3]) +
+                                  list(Permission.objects.order_by('pk')[:3]))
+        sorter = Sorter(self.rf.get('/', {'sort_objects': '-permission,id'}), 'objects')
+        expected = list(Through.objects.order_by('-permission', 'id').values_list('pk', flat=True))
+        # the ordering of the permissions spans their content types
+        for rows, queries in ((Through.objects.all(), 1),
+                              (Through.objects.select_related('permission__content_type'), 0)):
+            list(rows)
+            with self.assertNumQueries(queries):
+                self.assertEqual([row.pk for row in sorter.sort(rows)], expected)
+
+    def test_prefetched_related(self):
+        users = [mommy.make(User) for i in range(3)]
+        content_types = [ContentType.objects.get_for_model(model) for model in (User, LogEntry)]
+        for user in users:
+            for content_type in content_types:
+                mommy.make(LogEntry, user=user, content_type=content_type)
+        template = Template("""{% for user in users %}"""
+                            """{% sort user.logentry_set.all with "objects" as entries %}"""
+                            """{{ entries|sorter_tests_pks }};{% endfor %}""")
+        users = User.objects.filter(pk__in=[user.pk for user in users]).order_by('pk')
+        request = self.rf.get('/', {'sort_objects': '-content_type__model,id'})
+        expected = ''.join('%s;' % '.'.join(str(pk) for pk in user.logentry_set.order_by(
+            '-content_type__model', 'id').values_list('pk', flat=True)) for user in users)
+        # the content types of the entries aren't loaded, so the database sorts them
+        with self.assertNumQueries(2 + len(users)):
+            result = template.render(Context({
+                'request': request, 'users': users.prefetch_related('logentry_set')}))
+        self.assertEqual(result, expected)
+        with self.assertNumQueries(3):
+            result = template.render(Context({
+                'request': request,
+                'users': users.prefetch_related('logentry_set__content_type')}))
+        self.assertEqual(result, expected)
+
+    def test_limit(self):
+        items = [{'pk': pk, 'title': title} for pk, title in
+                 enumerate(['b', 'a', None, 'b', 'c', 'a'])]
+        for ordering in (['title'], ['-title'], ['title', '-pk'], ['-title', 'pk'], []):
+            for limit in (0, 1, 3, 10):
+                self.assertEqual(sort_objects(iter(items), ordering, limit),
+                                 sort_objects(items, ordering)[:limit])
+
+    def test_mappings(self):
+        items = [{'pk': 1, 'parent': {'title': 'b'}},
+                 {'pk': 2, 'parent': {'title': 'a'}},
+                 {'pk': 3, 'parent': None}]
+        self.assertEqual([item['pk'] for item in sort_objects(items, ['-parent__title'])],
+                         [1, 2, 3])
+        self.assertEqual(sort_objects([], ['pk']), [])
+
+    def test_tag(self):
+        entries = list(self.create_entries(3).order_by('?'))
+        self.assertViewRenders(
+            "{% sort objects as objects %}{{ objects|sorter_tests_pks }}",
+            ".".join(sorted((str(entry.pk) for entry in entries), reverse=True)),
+            {'sort': '-id'}, objects=entries)
+        self.assertViewRenders(
+            "{% sort objects as objects %}{% for obj in objects %}{{ obj.pk }}{% endfor %}",
+            "231", {'sort': 'title,-pk'},
+            objects=[{'pk': 1, 'title': 'b'}, {'pk': 2, 'title': 'a'}, {'pk': 3, 'title': 'b'}])
+        self.assertViewRenders(
+            "{% sort objects limit 2 as objects %}{% for obj in objects %}{{ obj.pk }}{% endfor %}",
+            "23", {'sort': 'title,-pk'},
+            objects=({'pk': pk, 'title': title} for pk, title in [(1, 'b'), (2, 'a'), (3, 'b')]))
+
+    def test_queryset_limit(self):
+        pks = sorted(entry.pk for entry in self.create_entries(3))
+        self.assertViewRenders(
+            "{% sort objects limit 2 as objects %}{{ objects|sorter_tests_pks }}",
+            "%s.%s" % (pks[2], pks[1]), {'sort': '-id'}, objects=LogEntry.objects.all())
+
+
+class CachedOrderingTests(SorterTestCase):
+
+    def setUp(self):
+        super(CachedOrderingTests, self).setUp()
+        get_cache().clear()
+        self.entries = self.create_entries(4)
+        self.pks = sorted(entry.pk for entry in self.entries)
+
+    def test_cached(self):
+        queryset = LogEntry.objects.filter(pk__in=self.pks)
+        with self.assertNumQueries(2):
+            objects = cached_ordering(queryset, ['-id'], limit=3)
+        self.assertEqual([obj.pk for obj in objects], self.pks[:0:-1])
+        with self.assertNumQueries(1):
+            objects = cached_ordering(queryset, ['-id'], limit=3)
+        self.assertEqual([obj.pk for obj in objects], self.pks[:0:-1])
+        with self.assertNumQueries(2):
+            cached_ordering(queryset, ['id'], limit=3)
+        self.assertEqual(cached_ordering(LogEntry.objects.none(), ['id'], limit=3), [])
+        self.assertRaises(ValueError, cached_ordering, queryset, ['id'])
+
+    def test_invalidation(self):
+        queryset = LogEntry.objects.filter(pk__in=self.pks)
+        cached_ordering(queryset, ['-id'], limit=10)
+        LogEntry.objects.get(pk=self.pks[-1]).delete()
+        with self.assertNumQueries(2):
+            objects = cached_ordering(queryset, ['-id'], limit=10)
+        self.assertEqual([obj.pk for obj in objects], self.pks[-2::-1])
+
+    def test_connect_models(self):
+        post_save.disconnect(sender=Group, dispatch_uid='sorter.cache.auth.group')
+        cache.invalidated_models.discard(Group)
+        version = cache.get_version(Group)
+        Group.objects.create(name='before')
+        self.assertEqual(cache.get_version(Group), version)
+        with override_settings(SORTER_MODELS={'groups': 'auth.Group'}):
+            cache.connect_models()
+        Group.objects.create(name='after')
+        self.assertNotEqual(cache.get_version(Group), version)
+
+    def test_tag(self):
+        template = "{% sort objects limit 2 cache 60 as sorted %}{{ sorted|sorter_tests_pks }}"
+        self.assertViewRenders(template, "%s.%s" % (self.pks[0], self.pks[1]),
+                               {'sort': 'id'}, objects=LogEntry.objects.all())
+        self.assertRaises(TemplateSyntaxError, Template,
+                          "{% sort objects cache 60 as sorted %}")
+
+
+@override_settings(SORTER_GUARD=True, SORTER_GUARD_ALLOW_FILESORT=False)
+class GuardTests(SorterTestCase):
+
+    def setUp(self):
+        super(GuardTests, self).setUp()
+        get_cache().clear()
+        self.pks = sorted(entry.pk for entry in self.create_entries(3))
+
+    def test_estimate(self):
+        self.assertEqual(estimate(
+            "Limit  (cost=1500.10..1500.35 rows=100 width=40)\n"
+            "  ->  Sort  (cost=1500.10..1750.10 rows=100000 width=40)\n"
+            "        Sort Key: title\n"
+            "        ->  Seq Scan on blog_post  (cost=0.00..1000.00 rows=100000 width=40)"),
+            (1500.35, 100000, True))
+        self.assertEqual(estimate(
+            "id=1 select_type=SIMPLE table=blog_post type=ALL rows=5000 Extra=Using filesort"),
+            (None, 5000, True))
+        self.assertEqual(estimate("detail=SCAN TABLE blog_post"), (None, None, False))
+        for detail in ('ORDER BY', 'RIGHT PART OF ORDER BY', 'LAST TERM OF ORDER BY'):
+            self.assertEqual(estimate("detail=SCAN TABLE blog_post USING INDEX blog_post_created\n"
+                                      "detail=USE TEMP B-TREE FOR %s" % detail),
+                             (None, None, True))
+
+    def test_guard(self):
+        queryset = LogEntry.objects.all()
+        self.assertEqual(guard_ordering(queryset, ['-id']), ['-id'])
+        self.assertEqual(guard_ordering(queryset, ['object_repr']), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(guard_ordering(queryset, ['object_repr']), [])
+        with override_settings(SORTER_GUARD_ACTION='reject'):
+            self.assertRaises(DisallowedOrdering, guard_ordering, queryset, ['object_repr'])
+        with override_settings(SORTER_GUARD_ALLOW_FILESORT=True):
+            get_cache().clear()
+            self.assertEqual(guard_ordering(queryset, ['object_repr']), ['object_repr'])
+
+    def test_tag(self):
+        template = "{% sort objects as sorted %}{{ sorted|sorter_tests_pks }}"
+        self.assertViewRenders(template, "%s.%s.%s" % tuple(self.pks),
+                               {'sort': 'id'}, objects=LogEntry.objects.all())
+        # falls back to the default ordering by the action time
+        self.assertViewRenders(template, "%s.%s.%s" % tuple(reversed(self.pks)),
+                               {'sort': 'object_repr'}, objects=LogEntry.objects.all())
+
+
+class NormalizeTests(SorterTestCase):
+
+    def test_normalize_ordering(self):
+        self.assertEqual(normalize_ordering(['title', 'title', '-title', 'author__username', '', '-']),
+                         ['title', 'author__username'])
+        self.assertEqual(normalize_ordering(['-a', 'b', 'a', 'c'], 2), ['-a', 'b'])
+
+    def test_max_criteria(self):
+        request = self.rf.get('/', data={'sort': 'id,-id,action_time,user,object_id'})
+        with override_settings(SORTER_MAX_CRITERIA=2):
+            self.assertEqual(get_state(request).ordering('sort'), ['id', 'action_time'])
+
+    def test_related_paths(self):
+        self.assertEqual(related_paths(LogEntry, ['-user__username', 'id', 'content_type__model',
+                                                  'user__email', 'user__groups__name']),
+                         ['user', 'content_type'])
+        self.assertEqual(related_paths(User, ['logentry__action_time', 'missing__name']), [])
+
+    def test_select_related(self):
+        self.create_entries(3, user=mommy.make(User))
+        template = "{% sort objects as sorted %}{% for obj in sorted %}{{ obj.user.username }}{% endfor %}"
+        request = self.rf.get('/', {'sort': 'user__username,-id'})
+        with self.assertNumQueries(1):
+            Template(template).render(Context({'request': request, 'objects': LogEntry.objects.all()}))
+
+    def test_deferred_fields(self):
+        self.create_entries(3, user=mommy.make(User))
+        template = "{% sort objects as sorted %}{% for obj in sorted %}{{ obj.pk }}{% endfor %}"
+        request = self.rf.get('/', {'sort': 'user__username,-id'})
+        expected = ''.join(str(pk) for pk in LogEntry.objects.order_by('user__username', '-id')
+                           .values_list('pk', flat=True))
+        for objects in (LogEntry.objects.only('id', 'object_repr'),
+                        LogEntry.objects.defer('user')):
+            self.assertEqual(Template(template).render(Context({'request': request,
+                                                                'objects': objects})),
+                             expected)
+
+
+class CriteriaMatcherTests(SorterTestCase):
+
+    def test_matching(self):
+        matcher = CriteriaMatcher(['title', 'author__*', 'c?eated'])
+        self.assertEqual(matcher.exact, set(['title']))
+        self.assertTrue(matcher('title'))
+        self.assertTrue(matcher('author__username'))
+        self.assertTrue(matcher('created'))
+        self.assertFalse(matcher('titles'))
+        self.assertFalse(matcher('author'))
+        self.assertFalse(matcher('ccreated'))
+
+    def test_exact_only(self):
+        matcher = CriteriaMatcher(['title'])
+        self.assertEqual(matcher.pattern, None)
+        self.assertFalse(matcher('author'))
+
+    def test_setting_changes(self):
+        self.assertTrue(get_matcher('sort')('anything'))
+        with override_settings(SORTER_ALLOWED_CRITERIA={'sort': ['id']}):
+            self.assertFalse(get_matcher('sort')('anything'))
+            self.assertEqual(get_matcher('sort_objects'), None)
+        self.assertTrue(get_matcher('sort')('anything'))
+
+
+class SortedEntryList(SortedListMixin, ListView):
+    model = LogEntry
+    sort_name = 'objects'
+    paginate_by = 2
+
+
+class EntryExport(SortedExportView):
+    model = LogEntry
+    sort_name = 'objects'
+    export_fields = ['id', 'user__username']
+    export_format = 'jsonl'
+    export_batch_size = 2
+
+
+class SorterTests(SorterTestCase):
+
+    def setUp(self):
+        super(SorterTests, self).setUp()
+        self.pks = sorted(entry.pk for entry in self.create_entries(3))
+
+    def test_sorter(self):
+        request = self.rf.get('/', {'sort_objects': '-id', 'sort': 'id'})
+        sorter = Sorter(request, 'objects')
+        self.assertEqual(sorter.name, 'sort_objects')
+        self.assertEqual(sorter.ordering, ['-id'])
+        self.assertEqual(Sorter(request).ordering, ['id'])
+        self.assertEqual([obj.pk for obj in sorter.sort(LogEntry.objects.all())],
+                         self.pks[::-1])
+        self.assertEqual([obj.pk for obj in sorter.sort(LogEntry.objects.all(), limit=1)],
+                         self.pks[-1:])
+        self.assertEqual(sorter.next_query(['-id', 'id']), 'id')
+        self.assertEqual(sorter.url(['id', '-id']), '/?sort=id&sort_objects=id')
+        self.assertFalse(sorter.presorted)
+
+    def test_batches(self):
+        self.create_entries(2)
+        pks = sorted(LogEntry.objects.values_list('pk', flat=True))
+        sorter = Sorter(self.rf.get('/', {'sort': '-id'}))
+        with self.assertNumQueries(3):
+            result = [[obj.pk for obj in batch]
+                      for batch in sorter.batches(LogEntry.objects.all(), size=2)]
+        self.assertEqual(result, [pks[:-3:-1], pks[-3:-5:-1], pks[:1]])
+        self.assertEqual([obj.pk for obj in sorter.iterate(LogEntry.objects.all(), size=2)],
+                         pks[::-1])
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(sorter.iterate(LogEntry.objects.all(), size=2,
+                                                     ordering=['user__username']))), 5)
+
+    def test_export(self):
+        request = self.rf.get('/', {'sort': '-id'})
+        response = export_response(request, LogEntry.objects.all(), ['id', 'object_id'],
+                                   filename='entries.csv', size=2)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="entries.csv"')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines, ['id,object_id'] +
+                         ['%s,' % pk for pk in self.pks[::-1]])
+        self.assertRaises(ValueError, export_response, request,
+                          LogEntry.objects.all(), ['id'], 'xml')
+
+    def test_export_view(self):
+        request = self.rf.get('/', {'sort_objects': 'id'})
+        response = EntryExport.as_view()(request)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        entries = LogEntry.objects.select_related('user')
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'id': entry.pk, 'user__username': entry.user.username}
+                          for entry in entries.order_by('id')])
+
+    def test_prefetch(self):
+        users = [mommy.make(User) for i in range(3)]
+        for user in users * 3:
+            mommy.make(LogEntry, user=user)
+        users = User.objects.filter(pk__in=[user.pk for user in users]).order_by('pk')
+        sorter = Sorter(self.rf.get('/', {'sort_objects': '-id'}), 'objects')
+        with self.assertNumQueries(2):
+            result = [[entry.pk for entry in user.logentry_set.all()] for user in
+                      users.prefetch_related(sorter.prefetch(
+                          'logentry_set', LogEntry.objects.all(), 'user', 2))]
+        self.assertEqual(result, [sorted(user.logentry_set.values_list('pk', flat=True),
+                                         reverse=True)[:2] for user in users])
+        with self.assertNumQueries(2):
+            result = [[entry.pk for entry in user.top] for user in
+                      users.prefetch_related(sorter.prefetch(
+                          'logentry_set', LogEntry.objects.filter(action_flag=-1),
+                          'user', 2, to_attr='top'))]
+        self.assertEqual(result, [[], [], []])
+
+    def test_prefetch_unsupported(self):
+        features = connection.features
+        name = ('allow_sliced_subqueries_with_in'
+                if hasattr(features, 'allow_sliced_subqueries_with_in')
+                else 'allow_sliced_subqueries')
+        setattr(features, name, False)
+        try:
+            self.assertRaises(NotSupportedError, partition_top,
+                              LogEntry.objects.all(), 'user', ['-id'], 2)
+        finally:
+            delattr(features, name)
+
+    def test_mixin(self):
+        request = self.rf.get('/', {'sort_objects': 'id'})
+        response = SortedEntryList.as_view()(request)
+        context = response.context_data
+        self.assertEqual([obj.pk for obj in context['object_list']], self.pks[:2])
+        self.assertEqual(context['paginator'].count, 3)
+        self.assertTrue(context['sorter'].presorted)
+        # the template tag doesn't sort the sliced page again
+        content = Template(
+            """{% sort object_list with "objects" as sorted %}{{ sorted|sorter_tests_pks }}"""
+        ).render(Context(dict(context, request=request)))
+        self.assertEqual(content, '%s.%s' % tuple(self.pks[:2]))
+
+
+class AliasTests(SorterTestCase):
+
+    def setUp(self):
+        super(AliasTests, self).setUp()
+        settings.SORTER_ALLOWED_CRITERIA = {'sort_objects': ['id', {
+            'repr_ci': Lower('object_repr').asc(nulls_last=True),
+            'flag': F('action_flag'),
+        }]}
+        for title, flag in (('b', 2), ('A', 3), ('c', 1)):
+            self.create_entries(1, object_repr=title, action_flag=flag)
+
+    def sorted_titles(self, query, **kwargs):
+        sorter = Sorter(self.rf.get('/', {'sort_objects': query}), 'objects')
+        return [obj.object_repr for obj in sorter.sort(LogEntry.objects.all(), **kwargs)]
+
+    def test_aliases(self):
+        self.assertTrue(get_matcher('sort_objects')('repr_ci'))
+        self.assertEqual(self.sorted_titles('repr_ci'), ['A', 'b', 'c'])
+        self.assertEqual(self.sorted_titles('-repr_ci'), ['c', 'b', 'A'])
+        self.assertEqual(self.sorted_titles('-flag,id'), ['A', 'b', 'c'])
+        self.assertEqual(self.sorted_titles('flag', limit=1), ['c'])
+        self.assertEqual(self.sorted_titles('-repr_ci', limit=10, cache=60), ['c', 'b', 'A'])
+
+    def test_resolve_ordering(self):
+        aliases = get_matcher('sort_objects').aliases
+        ordering = resolve_ordering(['-repr_ci', 'flag', 'id'], aliases)
+        self.assertTrue(ordering[0].descending and ordering[0].nulls_last)
+        self.assertFalse(aliases['repr_ci'].descending)
+        self.assertFalse(ordering[1].descending)
+        self.assertEqual(ordering[2], 'id')
+
+    def test_keyset(self):
+        self.assertEqual(self.sorted_titles('repr_ci', keyset=2), ['A', 'b'])
+        sorter = Sorter(self.rf.get('/', {'sort_objects': '-repr_ci'}), 'objects')
+        self.assertEqual([obj.object_repr for obj in
+                          sorter.iterate(LogEntry.objects.all(), size=2)],
+                         ['c', 'b', 'A'])
+
+    def test_objects(self):
+        items = [{'id': pk, 'object_repr': title} for pk, title in ((1, 'b'), (2, 'A'), (3, 'c'))]
+        for query, pks in (('repr_ci', [1, 2, 3]), ('repr_ci,-id', [3, 2, 1])):
+            sorter = Sorter(self.rf.get('/', {'sort_objects': query}), 'objects')
+            self.assertEqual([item['id'] for item in sorter.sort(items)], pks)
+            self.assertEqual([item['id'] for item in sorter.sort(items, limit=2)], pks[:2])
+
+    def test_indexes(self):
+        self.assertEqual(expand_criteria(LogEntry, ['id', {'id': Lower('object_repr')}]), [])
+
+
+class SortStateTests(SorterTestCase):
+
+    def test_ordering(self):
+        request = self.rf.get('/', data={'sort': '-id,action_time'})
+        state = get_state(request)
+        self.assertTrue(isinstance(state, SortState))
+        self.assertTrue(get_state(request) is state)
+        self.assertEqual(state.ordering('sort'), ['-id', 'action_time'])
+        self.assertTrue(state.ordering('sort') is state.ordering('sort'))
+        self.assertEqual(state.ordering('sort_objects'), [])
+
+    def test_queries(self):
+        request = self.rf.get('/', data={'sort': 'id', 'page': '2'})
+        state = get_state(request)
+        self.assertEqual(state.queries, {'sort': 'id', 'page': '2'})
+        self.assertEqual(state.url.path, '/')
+
+    def test_sort_url(self):
+        for path in ('/', '/path/?sort=id', '/path/?a=1&sort=id&b=%C3%A4+x',
+                     '/?b=2&a&sort_objects=-id', '/?sort=1&sort=2&c=%2C'):
+            request = self.rf.get(path)
+            state = get_state(request)
+            for name in ('sort', 'sort_objects'):
+                for query in ('title', '-title,author__name', u'\xe4 x'):
+                    self.assertEqual(state.sort_url(name, query),
+                                     state.url.set_query_param(name, query))
+
+    def test_shared_by_tags(self):
+        request = self.rf.get('/', data={'sort': 'id'})
+        Template("""
+            {% sort objects as sorted %}
+            {% sorturl by "id" "-id" %}
+            {% sortlink by "id" "-id" %}ID{% endsortlink %}
+        """).render(Context({'request': request,
+                             'objects': LogEntry.objects.all()}))
+        self.assertEqual(request.sort_state.orderings, {'sort': ['id']})
+
+    def test_middleware(self):
+        request = self.rf.get('/', data={'sort': 'id'})
+        SortStateMiddleware().process_request(request)
+        self.assertTrue(get_state(request) is request.sort_state)
+
+
+class KeysetTests(SorterTestCase):
+
+    def setUp(self):
+        super(KeysetTests, self).setUp()
+        self.entries = self.create_entries(5)
+        self.pks = sorted(entry.pk for entry in self.entries)
+
+    def pks_of(self, page):
+        return [obj.pk for obj in page]
+
+    def test_ordering(self):
+        self.assertEqual(keyset_ordering(LogEntry.objects.all(), ['-user__username']),
+                         ['-user__username', 'pk'])
+        self.assertEqual(keyset_ordering(LogEntry.objects.all(), ['title', '-id']),
+                         ['title', '-id'])
+        self.assertEqual(keyset_ordering(LogEntry.objects.all(), []),
+                         ['-action_time', 'pk'])
+
+    def test_filter(self):
+        self.assertEqual(str(keyset_filter(['action_flag', '-pk'], [1, 2], model=LogEntry)),
+                         str(Q(action_flag__gt=1) | Q(action_flag=1) & Q(pk__lt=2)))
+        self.assertEqual(str(keyset_filter(['action_flag', '-pk'], [1, 2], previous=True,
+                                           model=LogEntry)),
+                         str(Q(action_flag__lt=1) | Q(action_flag=1) & Q(pk__gt=2)))
+
+    def test_paginate(self):
+        page = paginate(self.entries, ['-id'], per_page=2)
+        self.assertEqual(self.pks_of(page), self.pks[:-3:-1])
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.previous_cursor, None)
+        page = paginate(self.entries, ['-id'], page.next_cursor, per_page=2)
+        self.assertEqual(self.pks_of(page), self.pks[2:0:-1])
+        page = paginate(self.entries, ['-id'], page.next_cursor, per_page=2)
+        self.assertEqual(self.pks_of(page), self.pks[:1])
+        self.assertFalse(page.has_next)
+        self.assertTrue(page.has_previous)
+        page = paginate(self.entries, ['-id'], page.previous_cursor, per_page=2)
+        self.assertEqual(self.pks_of(page), self.pks[2:0:-1])
+        page = paginate(self.entries, ['-id'], page.previous_cursor, per_page=2)
+        self.assertEqual(self.pks_of(page), self.pks[:-3:-1])
+        self.assertFalse(page.has_previous)
+
+    def test_mixed_directions(self):
+        user1, user2 = mommy.make(User, username='a'), mommy.make(User, username='b')
+        for entry, user in zip(self.entries, [user2, user1, user2, user1, user2]):
+            entry.user = user
+            entry.save()
+        ordering = ['user__username', '-action_time']
+        expected = list(self.entries.order_by(*keyset_ordering(self.entries, ordering)))
+        result, cursor = [], None
+        while True:
+            page = paginate(self.entries, ordering, cursor, per_page=2)
+            result.extend(page)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(result, expected)
+
+    def test_microseconds(self):
+        start = datetime(2018, 1, 1, 12, 0, 0)
+        for entry, microsecond in zip(self.entries, [123456, 123400, 123300, 100000, 50000]):
+            entry.action_time = start.replace(microsecond=microsecond)
+            entry.save()
+        for ordering in (['-action_time'], ['action_time']):
+            expected = list(self.entries.order_by(*keyset_ordering(self.entries, ordering)))
+            result, cursor = [], None
+            while True:
+                page = paginate(self.entries, ordering, cursor, per_page=1)
+                result.extend(page)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            self.assertEqual(result, expected)
+
+    def test_relations(self):
+        Through = User.user_permissions.through
+        self.assertEqual(keyset_ordering(LogEntry.objects.all(), ['-content_type', 'user__username']),
+                         ['-content_type_id', 'user__username', 'pk'])
+        self.assertEqual(keyset_ordering(Through.objects.all(), ['-permission']),
+                         ['-permission__content_type__app_label', '-permission__content_type__model',
+                          '-permission__codename', 'pk'])
+        user = mommy.make(User)
+        # the primary keys of the permissions don't follow their ordering
+        user.user_permissions.set(list(Permission.objects.order_by('-pk')[:3]) +
+                                  list(Permission.objects.order_by('pk')[:3]))
+        for ordering in (['permission'], ['-permission']):
+            expected = list(Through.objects.order_by(*ordering + ['pk']).values_list('pk', flat=True))
+            self.assertNotEqual(expected, sorted(expected))
+            cursor, pks = None, []
+            while True:
+                page = paginate(Through.objects.all(), ordering, cursor, per_page=2)
+                pks.extend(obj.pk for obj in page)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            self.assertEqual(pks, expected)
+            self.assertEqual([obj.pk for batch in batches(Through.objects.all(), ordering, 4)
+                              for obj in batch], expected)
+
+    def test_nulls(self):
+        for entry, object_id in zip(self.entries, ['b', None, 'a', None, 'c']):
+            entry.object_id = object_id
+            entry.save()
+        for ordering in (['object_id'], ['-object_id'], ['object_id', '-id']):
+            expected = list(self.entries.order_by(*keyset_ordering(self.entries, ordering)))
+            result, cursor = [], None
+            while True:
+                page = paginate(self.entries, ordering, cursor, per_page=1)
+                result.extend(page)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            self.assertEqual(result, expected)
+            # and back again
+            backwards = []
+            while True:
+                page = paginate(self.entries, ordering, page.previous_cursor, per_page=1)
+                backwards[:0] = list(page)
+                if not page.previous_cursor:
+                    break
+            self.assertEqual(backwards, expected[:-1])
+            self.assertEqual([entry for batch in batches(self.entries, ordering, 2)
+                              for entry in batch], expected)
+
+    def test_filter_nulls(self):
+        self.assertEqual(str(keyset_filter(['object_id', 'pk'], [None, 2], model=LogEntry)),
+                         str(Q(object_id__isnull=False) |
+                             Q(object_id__isnull=True) & Q(pk__gt=2)))
+        self.assertEqual(str(keyset_filter(['object_id', 'pk'], [None, 2], nulls_largest=True,
+                                           model=LogEntry)),
+                         str(Q(object_id__isnull=True) & Q(pk__gt=2)))
+        self.assertEqual(str(keyset_filter(['-object_id', 'pk'], ['1', 2], model=LogEntry)),
+                         str(Q(object_id__lt='1') | Q(object_id__isnull=True) |
+                             Q(object_id='1') & Q(pk__gt=2)))
+        self.assertFalse(nullable(LogEntry, 'user__username'))
+        self.assertTrue(nullable(LogEntry, 'content_type__model'))
+
+    def test_invalid_cursor(self):
+        page = paginate(self.entries, ['-id'], per_page=2)
+        for ordering, cursor in ((['id'], page.next_cursor), (['-id'], 'invalid')):
+            self.assertEqual(self.pks_of(paginate(self.entries, ordering, cursor, per_page=2)),
+                             self.pks_of(paginate(self.entries, ordering, per_page=2)))
+
+    def test_tag(self):
+        template = """{% sort objects keyset 2 as page %}{{ page|sorter_tests_pks }}|{{ page.next_url|safe }}"""
+        request = self.rf.get('/', data={'sort': 'id'})
+        content = Template(template).render(Context({'request': request, 'objects': self.entries}))
+        pks, url = content.split('|')
+        self.assertEqual(pks, '%s.%s' % tuple(self.pks[:2]))
+        request = self.rf.get(url)
+        content = Template(template + """{% sortlink by "-id" %}ID{% endsortlink %}""").render(
+            Context({'request': request, 'objects': self.entries}))
+        self.assertTrue(content.startswith('%s.%s|/?sort=id&sort_cursor=' % tuple(self.pks[2:4])))
+        self.assertTrue('<a href="/?sort=-id"' in content)
+
+    @override_settings(SORTER_CANONICAL=True)
+    def test_canonical_tag(self):
+        template = ("""{% sort objects keyset 2 as page %}{{ page|sorter_tests_pks }}|"""
+                    """{{ page.next_url|default:""|safe }}""")
+        url = '/?sort=id,id'
+        for pks in (self.pks[:2], self.pks[2:4], self.pks[4:]):
+            content = Template(template).render(Context({'request': self.rf.get(url),
+                                                         'objects': self.entries}))
+            self.assertEqual(content.split('|')[0], '.'.join(str(pk) for pk in pks))
+            url = content.split('|')[1]
+            if url:
+                self.assertTrue(url.startswith('/?sort=id&sort_cursor='))
+                self.assertTrue(len(url) > len('/?sort=id&sort_cursor='))
+
+
+@override_settings(SORTER_MODELS={'sort': 'admin.LogEntry'})
+class IndexTests(SorterTestCase):
+
+    def test_expand_criteria(self):
+        paths = expand_criteria(LogEntry, ['action_*', 'user__*'])
+        self.assertTrue('action_time' in paths)
+        self.assertTrue('action_flag' in paths)
+        self.assertTrue('user__username' in paths)
+        self.assertTrue('content_type__app_label' not in paths)
+        self.assertTrue('user__groups' not in paths)
+
+    def test_is_indexed(self):
+        self.assertTrue(is_indexed(LogEntry, ['-id']))
+        self.assertTrue(is_indexed(LogEntry, ['user']))
+        self.assertTrue(is_indexed(LogEntry, ['user_id']))
+        self.assertTrue(is_indexed(LogEntry, ['-user__username']))
+        self.assertFalse(is_indexed(LogEntry, ['action_time']))
+        self.assertFalse(is_indexed(LogEntry, ['user__first_name']))
+        self.assertFalse(is_indexed(LogEntry, ['user', '-id']))
+        self.assertTrue(is_indexed(ContentType, ['app_label', 'model']))
+        self.assertTrue(is_indexed(ContentType, ['-app_label', '-model']))
+        self.assertFalse(is_indexed(ContentType, ['app_label', '-model']))
+        self.assertFalse(is_indexed(ContentType, ['model']))
+
+    def test_suggest_index(self):
+        model, index = suggest_index(LogEntry, ['-action_time', 'object_id'])
+        self.assertEqual(model, LogEntry)
+        self.assertEqual(index.fields, ['-action_time', 'object_id'])
+        self.assertTrue(len(index.name) <= 30)
+        model, index = suggest_index(LogEntry, ['user__first_name'])
+        self.assertEqual(model, User)
+        self.assertEqual(suggest_index(LogEntry, ['user__first_name', 'id']), None)
+
+    def test_check(self):
+        with override_settings(SORTER_ALLOWED_CRITERIA={'sort': ['id', 'action_time', 'user__username']}):
+            errors = check_indexes()
+        self.assertEqual([error.id for error in errors], ['sorter.W001'])
+        self.assertTrue("'action_time'" in errors[0].msg)
+        with override_settings(SORTER_MODELS={'sort': 'admin.Missing'}):
+            self.assertEqual([error.id for error in check_indexes()], ['sorter.E001'])
+
+    def test_command(self):
+        out = StringIO()
+        with override_settings(SORTER_ALLOWED_CRITERIA={'sort': ['id', 'action_time']}):
+            call_command('sorter_indexes', ordering=['sort=user,-action_time'],
+                         suggest=True, stdout=out)
+        output = out.getvalue()
+        self.assertTrue("sort (admin.LogEntry)" in output)
+        self.assertTrue("  action_time: no index" in output)
+        self.assertTrue("  user,-action_time: no index" in output)
+        self.assertTrue("  id: no index" not in output)
+        self.assertTrue("admin.LogEntry: models.Index(fields=['user', '-action_time']" in output)
+        self.assertRaises(CommandError, call_command, 'sorter_indexes', 'sort_missing')
+
+
+class CanonicalTests(SorterTestCase):
+
+    def test_canonical_url(self):
+        state = get_state(self.rf.get('/', {'sort': 'a,a,-a,b', 'page': '2', 'b': ['2', '1']}))
+        self.assertEqual(state.canonical_url(), '/?b=2&b=1&page=2&sort=a%2Cb')
+        self.assertEqual(state.canonical_url({'page': []}), '/?b=2&b=1&sort=a%2Cb')
+        state = get_state(self.rf.get('/', {'sort': ',,'}))
+        self.assertEqual(state.canonical_url(), '/')
+
+    def test_default_orderings(self):
+        with override_settings(SORTER_DEFAULT_ORDERINGS={'sort': '-b'}):
+            state = get_state(self.rf.get('/', {'sort': '-b,-b'}))
+            self.assertEqual(state.canonical_url(), '/')
+            self.assertEqual(get_state(self.rf.get('/')).ordering('sort'), ['-b'])
+            sorter = Sorter(self.rf.get('/'))
+            self.assertEqual(sorter.next_query(['-b', 'b']), 'b')
+
+    def test_sort_url(self):
+        request = self.rf.get('/', {'z': '1', 'sort_objects': 'b,b', 'sort_cursor': 'x'})
+        with override_settings(SORTER_CANONICAL=True,
+                               SORTER_DEFAULT_ORDERINGS={'sort': 'a'}):
+            state = get_state(request)
+            self.assertEqual(state.sort_url('sort', 'b,b,a'),
+                             '/?sort=b%2Ca&sort_objects=b&z=1')
+            self.assertEqual(state.sort_url('sort', 'a'), '/?sort_objects=b&z=1')
+
+    def test_middleware(self):
+        middleware = CanonicalSortMiddleware()
+        request = self.rf.get('/?sort=b,b&page=2')
+        response = middleware.process_request(request)
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], '/?page=2&sort=b')
+        self.assertEqual(middleware.process_request(self.rf.get(response['Location'])),
+                         None)
+        self.assertEqual(middleware.process_request(self.rf.get('/?z=1&a=2')), None)
+        self.assertEqual(middleware.process_request(self.rf.post('/?sort=b,b')), None)
+
+
+class ConditionTests(SorterTestCase):
+
+    def setUp(self):
+        super(ConditionTests, self).setUp()
+        self.create_entries(2)
+        self.calls = []
+
+        @sorted_condition(LogEntry.objects.all(), 'objects', 'action_time')
+        def view(request):
+            self.calls.append(request)
+            return HttpResponse('ok')
+        self.view = view
+
+    def test_not_modified(self):
+        response = self.view(self.rf.get('/', {'sort_objects': 'id'}))
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.view(self.rf.get('/', {'sort_objects': 'id,id'},
+                                             HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        response = self.view(self.rf.get('/', {'sort_objects': 'id'},
+                                         HTTP_IF_MODIFIED_SINCE=last_modified))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_modified(self):
+        etag = self.view(self.rf.get('/', {'sort_objects': 'id'}))['ETag']
+        for query in ({'sort_objects': '-id'}, {'sort_objects': 'id', 'page': 2}):
+            response = self.view(self.rf.get('/', query, HTTP_IF_NONE_MATCH=etag))
+            self.assertEqual(response.status_code, 200)
+        self.create_entries(1)
+        response = self.view(self.rf.get('/', {'sort_objects': 'id'},
+                                         HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_changed(self):
+        @sorted_condition(LogEntry.objects.all(), 'objects')
+        def view(request):
+            return HttpResponse('ok')
+
+        etag = view(self.rf.get('/', {'sort_objects': 'id'}))['ETag']
+        response = view(self.rf.get('/', {'sort_objects': 'id'}, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        entry = LogEntry.objects.order_by('id')[0]
+        entry.object_repr = 'changed'
+        entry.save()
+        response = view(self.rf.get('/', {'sort_objects': 'id'}, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+
+
+class TimingTests(SorterTestCase):
+
+    template = """
+        {% sort objects with "objects" as sorted %}
+        {% sortlink with "objects" by "id" %}{% sorturl by "id" %}{% endsortlink %}
+        {% sortform by "id" %}ID{% endsortform %}
+    """
+
+    def render(self, request):
+        Template(self.template).render(Context({'request': request,
+                                                'objects': LogEntry.objects.all()}))
+
+    def test_signal(self):
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append(kwargs)
+
+        tag_timed.connect(receiver)
+        try:
+            self.render(self.rf.get('/'))
+            self.assertEqual(received, [])
+            with override_settings(SORTER_TIMING=True):
+                self.render(self.rf.get('/'))
+        finally:
+            tag_timed.disconnect(receiver)
+        self.assertEqual([(kwargs['tag'], kwargs['name'], kwargs['links']) for kwargs in received],
+                         [('sort', 'sort_objects', 0), ('sorturl', 'sort', 1),
+                          ('sortlink', 'sort_objects', 1), ('sortform', 'sort', 1)])
+        self.assertEqual([phase for phase, duration in received[0]['timings']],
+                         ['resolve', 'validate', 'sort'])
+        self.assertEqual([phase for phase, duration in received[2]['timings']],
+                         ['resolve', 'query', 'url', 'render'])
+        self.assertTrue(received[2]['total'] >= sum(duration for phase, duration in received[2]['timings']))
+
+    @override_settings(SORTER_TIMING=True)
+    def test_middleware(self):
+        request = self.rf.get('/')
+        middleware = TimingMiddleware()
+        middleware.process_request(request)
+        self.render(request)
+        response = middleware.process_response(request, HttpResponse())
+        self.assertTrue(response['Server-Timing'].startswith('sorter;dur='))
+        self.assertTrue('desc="4 tags, 3 links"' in response['Server-Timing'])
+        self.assertTrue('sorter-render;dur=' in response['Server-Timing'])
+
+    @override_settings(SORTER_TIMING=True)
+    def test_sortcache(self):
+        get_cache().clear()
+        template = Template("""{% sortcache "toolbar" %}"""
+                            """{% sortlink by "id" %}ID{% endsortlink %}{% endsortcache %}""")
+        middleware = TimingMiddleware()
+        for desc in ('2 tags, 1 links', '1 tags, 0 links'):
+            request = self.rf.get('/')
+            middleware.process_request(request)
+            template.render(Context({'request': request}))
+            response = middleware.process_response(request, HttpResponse())
+            self.assertTrue('desc="%s"' % desc in response['Server-Timing'])
+
+
 class SortURLTests(SorterTestCase):
 
     def test_cycle_pairs(self):
@@ -167,6 +1082,35 @@ class SortURLTests(SorterTestCase):
             """/?sort=creation_date""")
 
 
+class FoldingTests(SorterTestCase):
+
+    def test_constants(self):
+        node = Template("""{% sortlink with "objects" by "a" "-a" "a" %}A{% endsortlink %}"""
+                        ).nodelist[0]
+        self.assertEqual(node.constants['with'], 'sort_objects')
+        self.assertEqual(node.next_queries, {'a': '-a', '-a': 'a'})
+        self.assertEqual(node.template_names,
+                         ['sorter/sortlink.html', 'sorter/sortlink_sort_objects.html'])
+        node = Template("""{% sorturl with name by ordering "b" %}""").nodelist[0]
+        self.assertEqual(node.constants, {})
+        self.assertEqual(node.next_queries, node.template_names, None)
+
+    def test_titles(self):
+        template = Template("""{% sortlink by "a" "-a" %}A{% endsortlink %}""")
+        node = template.nodelist[0]
+        request = self.rf.get('/', {'sort': 'a'})
+        self.assertIn("(desc)", template.render(Context({'request': request})))
+        with translation.override('de'):
+            self.assertIn("Sortieren", template.render(Context({'request': request})))
+        self.assertEqual(sorted(node.titles), [('-a', 'de'), ('-a', 'en-us')])
+
+    def test_variables(self):
+        self.assertViewRenders(
+            """{% sorturl with name by first second %}""",
+            "/?sort_objects=b", {'sort_objects': 'a'},
+            name='objects', first='a', second='b')
+
+
 class SortlinkTests(SorterTestCase):
 
     def test_simple(self):
@@ -194,6 +1138,81 @@ class SortlinkTests(SorterTestCase):
             """{% sortlink with "objects" by "creation_date,-title" %}"""
             """{% endsortlink %}""")
 
+    def test_template_cache(self):
+        self.assertViewRenders(
+            """{% sortlink with "objects" by "title" %}Title{% endsortlink %}""",
+            """<a href="/?sort_objects=title" """)
+        self.assertEqual(sorter_tags.templates[('sortlink', 'sort_objects')].origin.template_name,
+                         'sorter/sortlink.html')
+
+    def test_inherit_context(self):
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {
+                'loaders': [('django.template.loaders.locmem.Loader', {
+                    'sorter/sortlink.html': '{{ label }}:{{ outer }}',
+                })],
+                'builtins': ['sorter.templatetags.sorter_tags'],
+            },
+        }]
+        template = """{% sortlink by "title" %}Title{% endsortlink %}"""
+        with override_settings(TEMPLATES=templates):
+            self.assertViewRenders(template, "Title:", outer='Outer')
+            self.assertViewNotRenders(template, "Outer", outer='Outer')
+            with override_settings(SORTER_INHERIT_CONTEXT=True):
+                self.assertViewRenders(template, "Title:Outer", outer='Outer')
+
+
+class SortCacheTests(SorterTestCase):
+
+    def setUp(self):
+        super(SortCacheTests, self).setUp()
+        get_cache().clear()
+
+    def render(self, query, label='Title'):
+        template = Template("""{% sortcache "toolbar" with "objects" %}"""
+                            """{% sortlink with "objects" by "title" "-title" %}"""
+                            """{{ label }}{% endsortlink %}{% endsortcache %}""")
+        request = self.rf.get('/', query)
+        return template.render(Context({'request': request, 'label': label}))
+
+    def test_cached(self):
+        link = ('<a href="/?sort_objects=%s" title="Sort by: &#39;title&#39; (%s)">'
+                '%s</a>')
+        self.assertEqual(self.render({}), link % ('title', 'asc', 'Title'))
+        self.assertEqual(self.render({}, 'Other'), link % ('title', 'asc', 'Title'))
+        # the current query, the other parameters and the language vary
+        self.assertEqual(self.render({'sort_objects': 'title'}, 'Other'),
+                         link % ('-title', 'desc', 'Other'))
+        self.assertEqual(self.render({'page': 2}, 'Page'),
+                         link.replace('/?', '/?page=2&amp;') % ('title', 'asc', 'Page'))
+        with translation.override('de'):
+            self.assertIn('>Titel</a>', self.render({}, 'Titel'))
+
+    def test_links(self):
+        template = ("""{% sortcache "toolbar" with "objects" %}"""
+                    """{% sortlink with "objects" by BY %}Title{% endsortlink %}"""
+                    """{% endsortcache %}""")
+        request = self.rf.get('/')
+        # the orderings of the links and their templates vary
+        for by, ordering in (('"title"', 'title'), ('"-title"', '-title'),
+                             ('ordering', 'id'), ('ordering', '-id')):
+            content = Template(template.replace('BY', by)).render(
+                Context({'request': request, 'ordering': ordering}))
+            self.assertIn('?sort_objects=%s"' % ordering, content)
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {
+                'loaders': [('django.template.loaders.locmem.Loader', {
+                    'sorter/sortlink.html': 'Custom {{ label }}',
+                })],
+                'builtins': ['sorter.templatetags.sorter_tags'],
+            },
+        }]
+        with override_settings(TEMPLATES=templates):
+            self.assertEqual(Template(template.replace('BY', '"title"')).render(
+                Context({'request': request})), 'Custom Title')
+
 
 class SortFormTests(SorterTestCase):
 
@@ -205,3 +1224,47 @@ class SortFormTests(SorterTestCase):
     <input type="hidden" name="sort" value="creation_date" />
     <input type="submit" value="Creation date" title="Sort by: &#39;creation_date&#39; (asc)" />
 </form>""")
+
+
+@skipIf(Jinja2 is None, "Jinja2 isn't installed")
+class JinjaTests(SorterTestCase):
+
+    def render(self, source, query=None, **context):
+        engine = Jinja2({
+            'NAME': 'jinja2',
+            'DIRS': [],
+            'APP_DIRS': True,
+            'OPTIONS': {'extensions': ['sorter.jinja.SorterExtension']},
+        })
+        request = self.rf.get('/', query or {})
+        return engine.from_string(source).render(context, request)
+
+    def test_sorturl(self):
+        self.assertEqual(self.render('{{ sorturl("creation_date", "-title") }}'),
+                         '/?sort=creation_date')
+        self.assertEqual(self.render('{{ sorturl("a", "b", name="objects") }}',
+                                     {'sort_objects': 'a'}),
+                         '/?sort_objects=b')
+
+    def test_sortlink(self):
+        self.assertEqual(
+            self.render('{{ sortlink("Creation <date>", "creation_date", rel="nofollow") }}'),
+            '<a href="/?sort=creation_date" title="Sort by: &#39;creation_date&#39; (asc)" '
+            'rel="nofollow">Creation &lt;date&gt;</a>')
+
+    def test_sortform(self):
+        self.assertEqual(
+            self.render('{{ sortform("Title", "title", name="objects") }}'),
+            """\
+<form action="" method="get">
+    <input type="hidden" name="sort_objects" value="title" />
+    <input type="submit" value="Title" title="Sort by: &#39;title&#39; (asc)" />
+</form>""")
+
+    def test_sort(self):
+        pks = sorted(entry.pk for entry in self.create_entries(3))
+        source = ('{% for obj in sort(objects, "objects", limit=2) %}'
+                  '{{ obj.pk }},{% endfor %}')
+        self.assertEqual(self.render(source, {'sort_objects': '-id'},
+                                     objects=LogEntry.objects.all()),
+                         '%s,%s,' % (pks[2], pks[1]))
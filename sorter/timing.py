@@ -0,0 +1,64 @@
+from collections import defaultdict
+from timeit import default_timer
+
+from sorter.signals import tag_timed
+
+
+class Timer(object):
+    """
+    Records the durations of the phases of a single template tag
+    invocation.
+    """
+    def __init__(self):
+        self.name = None
+        self.timings = []
+        self.start = self.last = default_timer()
+
+    def lap(self, phase):
+        now = default_timer()
+        self.timings.append((phase, now - self.last))
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+
+class TimingCollector(object):
+    """
+    Aggregates the timings of all sorter template tags of a request.
+    """
+    def __init__(self):
+        self.tags = 0
+        self.links = 0
+        self.total = 0.0
+        self.phases = defaultdict(float)
+        self.names = defaultdict(float)
+
+    def add(self, name, links, timings, total):
+        self.tags += 1
+        self.links += links
+        self.total += total
+        self.names[name] += total
+        for phase, duration in timings:
+            self.phases[phase] += duration
+
+    def header(self):
+        """
+        Returns the timings as the value of a ``Server-Timing`` header,
+        in milliseconds.
+        """
+        metrics = ['sorter;dur=%.3f;desc="%s tags, %s links"' %
+                   (self.total * 1000, self.tags, self.links)]
+        metrics.extend('sorter-%s;dur=%.3f' % (phase, duration * 1000)
+                       for phase, duration in sorted(self.phases.items()))
+        return ', '.join(metrics)
+
+
+def collect(sender, name, links, timings, total, request, **kwargs):
+    collector = getattr(request, 'sorter_timings', None)
+    if collector is not None:
+        collector.add(name, links, timings, total)
+
+
+tag_timed.connect(collect, dispatch_uid='sorter.timing.collect')
@@ -1,4 +1,11 @@
-from itertools import tee, izip, chain
+import heapq
+from collections import Mapping
+from itertools import tee, izip, chain, islice
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model
+from django.db.models.expressions import OrderBy
 
 
 def cycle_pairs(iterable):
@@ -11,3 +18,203 @@ def cycle_pairs(iterable):
     a, b = tee(iterable)
     iter(b).next()
     return chain(izip(a, b), [(last, first)])
+
+
+def normalize_ordering(ordering, limit=None):
+    """
+    Removes duplicate and conflicting fields from the given ordering
+    values, keeping the first occurrence of each field, and optionally
+    limits the number of fields.
+    """
+    seen = set()
+    result = []
+    for value in ordering:
+        field = value.lstrip('-')
+        if not field or field in seen:
+            continue
+        seen.add(field)
+        result.append(value)
+    return result[:limit]
+
+
+def resolve_ordering(ordering, aliases):
+    """
+    Returns the given ordering values with the names of the given sort
+    aliases replaced by their expressions, descending if prefixed
+    with ``-``.
+    """
+    result = []
+    for value in ordering:
+        expression = aliases.get(value.lstrip('-'))
+        if expression is None:
+            result.append(value)
+            continue
+        descending = value.startswith('-')
+        if isinstance(expression, OrderBy):
+            # keep the configured placement of nulls
+            expression = expression.copy()
+            expression.descending = expression.descending != descending
+        elif descending:
+            expression = expression.desc()
+        else:
+            expression = expression.asc()
+        result.append(expression)
+    return result
+
+
+def related_paths(model, ordering):
+    """
+    Returns the paths of the forward relations the given ordering
+    values span, suitable for ``select_related()``.
+    """
+    paths = []
+    for value in ordering:
+        parts = value.lstrip('-').split('__')[:-1]
+        current, path = model, []
+        for part in parts:
+            try:
+                field = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                break
+            # generic foreign keys can't be selected
+            if not (field.many_to_one and field.concrete or field.one_to_one):
+                break
+            path.append(part)
+            current = field.related_model
+        if path and '__'.join(path) not in paths:
+            paths.append('__'.join(path))
+    # only keep the longest paths, the shorter ones are implied
+    return [shorter for shorter in paths
+            if not any(other.startswith(shorter + '__') for other in paths)]
+
+
+def is_cached(obj, field):
+    """
+    Returns whether the related objects the given ``__`` separated
+    field spans are already loaded on the given model instance, so
+    getting its value doesn't query them.
+    """
+    for part in field.split('__')[:-1]:
+        descriptor = getattr(type(obj), part, None)
+        if not hasattr(descriptor, 'is_cached') or not descriptor.is_cached(obj):
+            return False
+        obj = getattr(obj, part)
+        if obj is None:
+            break
+    return True
+
+
+def sort_key(field, sample, nulls_largest=False):
+    """
+    Returns a key function for the given ordering field (without a
+    leading ``-``), following ``__`` separated lookups through items of
+    mappings or attributes of other objects, depending on the sample.
+
+    ``None`` values (including those of missing related objects)
+    sort before all other values, or after them if ``nulls_largest``
+    is true, like in databases such as PostgreSQL. Related objects
+    sort by their primary key.
+    """
+    parts = field.split('__')
+    if isinstance(sample, Model) and len(parts) == 1:
+        try:
+            model_field = sample._meta.get_field(field)
+        except FieldDoesNotExist:
+            pass
+        else:
+            # use the stored primary key of related objects
+            if model_field.concrete and model_field.is_relation:
+                parts = [model_field.attname]
+    if isinstance(sample, Mapping):
+        getters = [itemgetter(part) for part in parts]
+    else:
+        getters = [attrgetter(part) for part in parts]
+
+    if len(getters) == 1:
+        getter = getters[0]
+
+        def key(obj):
+            value = getter(obj)
+            if isinstance(value, Model):
+                value = value.pk
+            return (value is None) == nulls_largest, value
+    else:
+        def key(obj):
+            for getter in getters:
+                obj = getter(obj)
+                if obj is None:
+                    break
+            if isinstance(obj, Model):
+                obj = obj.pk
+            return (obj is None) == nulls_largest, obj
+    return key
+
+
+class Descending(object):
+    """
+    Wraps a sort key to invert its comparison.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def ordering_key(ordering, sample, nulls_largest=False):
+    """
+    Returns a single key function for all the given ordering fields.
+    """
+    keys = []
+    for field in ordering:
+        key = sort_key(field.lstrip('-'), sample, nulls_largest)
+        if field.startswith('-'):
+            key = (lambda key: lambda obj: Descending(key(obj)))(key)
+        keys.append(key)
+    return lambda obj: tuple([key(obj) for key in keys])
+
+
+def top_objects(iterable, ordering, limit, nulls_largest=False):
+    """
+    Returns a list of the first ``limit`` objects of the given iterable
+    (e.g. a generator) when sorted by the given ordering values, in a
+    single pass, only holding ``limit`` objects in memory.
+    """
+    iterator = iter(iterable)
+    if not ordering:
+        return list(islice(iterator, limit))
+    try:
+        sample = next(iterator)
+    except StopIteration:
+        return []
+    return heapq.nsmallest(limit, chain([sample], iterator),
+                           key=ordering_key(ordering, sample, nulls_largest))
+
+
+def sort_objects(iterable, ordering, limit=None, nulls_largest=False):
+    """
+    Sorts the given iterable of objects or mappings by the given
+    ordering values in Python, returning a new list, optionally
+    limited to the first ``limit`` objects.
+
+    Each field is sorted in its own stable pass, starting with the
+    last, to handle mixed sort directions.
+    """
+    if limit is not None:
+        return top_objects(iterable, ordering, limit, nulls_largest)
+    result = list(iterable)
+    if not result:
+        return result
+    for field in reversed(ordering):
+        descending = field.startswith('-')
+        result.sort(key=sort_key(field.lstrip('-'), result[0], nulls_largest),
+                    reverse=descending)
+    return result
@@ -0,0 +1,49 @@
+from django.views.generic.list import MultipleObjectMixin
+from django.views.generic import View
+
+from sorter.base import Sorter
+from sorter.export import export_response
+
+
+class SortedListMixin(object):
+    """
+    A mixin for list views, e.g. ``ListView``, that sorts the queryset
+    by the ordering of the request before it's paginated.
+
+    The template tags don't sort the objects again for the same
+    name of the sorting.
+    """
+    sort_name = None
+    sort_limit = None
+    sort_cache = None
+    sorter_class = Sorter
+
+    def get_sorter(self):
+        return self.sorter_class(self.request, self.sort_name)
+
+    def get_queryset(self):
+        queryset = super(SortedListMixin, self).get_queryset()
+        self.sorter = self.get_sorter()
+        return self.sorter.presort(queryset, limit=self.sort_limit,
+                                   cache=self.sort_cache)
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('sorter', self.sorter)
+        return super(SortedListMixin, self).get_context_data(**kwargs)
+
+
+class SortedExportView(MultipleObjectMixin, View):
+    """
+    A view streaming the given fields of the objects of its queryset,
+    sorted by the ordering of the request, as CSV or JSON Lines.
+    """
+    sort_name = None
+    export_fields = ()
+    export_format = 'csv'
+    export_filename = None
+    export_batch_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        return export_response(request, self.get_queryset(), self.export_fields,
+                               self.export_format, self.sort_name,
+                               self.export_filename, self.export_batch_size)